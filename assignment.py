@@ -0,0 +1,95 @@
+"""
+Player-to-car assignment (自動割り当て) shared by the app tabs and the CLI.
+"""
+import random
+
+# Grades handled by each assignment tab, in queue order
+UPPER_GRADES = (5, 6)  # 🎯 高：Sheet2
+LOWER_GRADES = (1, 2, 3, 4)  # 🎯 低：Sheet3
+
+
+def available_seats(driver_capacities, selected_drivers):
+    return sum(driver_capacities[d] for d in selected_drivers if d in driver_capacities)
+
+
+def assign_cars(roster, selected_players, selected_drivers, grades, rng=random):
+    """
+    Assigns the selected players to the selected drivers' cars using a roster.Roster snapshot.
+
+    Children ride with their parent first, the rest are shuffled within each grade (in `grades`
+    order) and dealt round-robin, preferring each car's grade; single-kid cars are then topped up.
+    Returns ({driver: [players]}, {driver: capacity}) for cars that got at least one player.
+    """
+    # ✅ Organize players by grade, using the roster's precomputed grade buckets
+    player_grades = {p: roster.grade_of(p) for p in selected_players if p in roster.name_index}
+    player_queue = []
+    for grade in grades:
+        bucket = [p for p in roster.grade_buckets.get(grade, ()) if p in selected_players]
+        rng.shuffle(bucket)  # ✅ Shuffle each grade separately
+        player_queue += bucket  # ✅ Maintain order by grade
+
+    # ✅ Sort drivers by capacity (largest first)
+    driver_capacities = {d: roster.capacity_of(d) for d in sorted(selected_drivers) if d in roster.driver_index}
+    sorted_drivers = sorted(driver_capacities.items(), key=lambda x: x[1], reverse=True)
+
+    # ✅ Assign parent-child first and determine grade preference
+    player_parents = {p: roster.parent_of(p) for p in roster.names if p in selected_players and roster.parent_of(p) in selected_drivers}
+    assignments = {driver: [] for driver, _ in sorted_drivers}
+    car_grade_preference = {}
+
+    for player, parent in player_parents.items():
+        if parent in assignments and player in player_queue:
+            assignments[parent].append(player)
+            car_grade_preference[parent] = player_grades[player]  # ✅ Determine the preferred grade level
+            player_queue.remove(player)
+
+    # ✅ Step 2: Grade-Aware Round-Robin Assignment
+    driver_seats = {driver: capacity - len(assignments[driver]) for driver, capacity in sorted_drivers}
+
+    while player_queue and any(seats > 0 for seats in driver_seats.values()):
+        sorted_available_drivers = sorted(driver_seats.items(), key=lambda x: x[1], reverse=True)
+        for driver, seats in sorted_available_drivers:
+            if seats > 0 and player_queue:
+                preferred_grade = car_grade_preference.get(driver, None)
+
+                # ✅ Try to assign a player of the preferred grade first
+                assigned = False
+                for player in player_queue:
+                    if preferred_grade and player_grades[player] == preferred_grade:
+                        assignments[driver].append(player)
+                        driver_seats[driver] -= 1
+                        player_queue.remove(player)
+                        assigned = True
+                        break
+
+                # ✅ If no preferred grade players left, assign any remaining player
+                if not assigned and player_queue:
+                    assignments[driver].append(player_queue.pop(0))
+                    driver_seats[driver] -= 1
+
+    # ✅ Step 3: Prevent Single-Kid Cars
+    single_kid_cars = [d for d, p in assignments.items() if len(p) == 1]
+    multi_kid_cars = [d for d, p in assignments.items() if len(p) >= 3]
+
+    if single_kid_cars and multi_kid_cars:
+        for single_car in single_kid_cars:
+            for multi_car in multi_kid_cars:
+                if len(assignments[multi_car]) > 2:
+                    moved_player = assignments[multi_car].pop()
+                    assignments[single_car].append(moved_player)
+                    break
+
+    assignments = {driver: players for driver, players in assignments.items() if players}
+    return assignments, {driver: driver_capacities[driver] for driver in assignments}
+
+
+def format_assignment_text(assignments, driver_capacities):
+    """
+    Returns the plain-text result used for clipboard copying.
+    """
+    assignment_lines = []
+    for driver, players in assignments.items():
+        assignment_lines.append(f"🚗 {driver} の車 ({driver_capacities[driver]}人乗り)")
+        for player in players:
+            assignment_lines.append(f"- {player}")
+    return "\n".join(assignment_lines)
@@ -0,0 +1,241 @@
+"""
+Memoized 自動割り当て results with an append-only history.
+
+A result is keyed by a hash of the team, roster sheet and version, selected
+players and drivers, grades and seed, so the same inputs always give back the
+same cars, in any session and without recomputing. New results are kept in
+memory and appended to the history (a worksheet in the app, a JSONL file
+from the CLI) in batches.
+"""
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from assignment import assign_cars
+
+HISTORY_SHEET = "割り当て履歴"
+HISTORY_COLUMNS = ["日時", "キー", "チーム", "シート", "名簿バージョン", "シード", "選手", "運転手", "結果"]
+
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_FLUSH_SECONDS = 60
+DEFAULT_MAX_ENTRIES = 512
+
+logger = logging.getLogger(__name__)
+
+
+def assignment_key(team_key, sheet_title, roster_version, players, drivers, grades, seed):
+    """
+    Returns a stable hash of everything that determines an assignment result.
+    """
+    payload = json.dumps(
+        [team_key, sheet_title, roster_version, sorted(players), sorted(drivers), list(grades), seed],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def default_seed(day=None):
+    """
+    Today's date as YYYYMMDD, so everyone gets the same answer for the same game day.
+    """
+    return int(time.strftime("%Y%m%d", day or time.localtime()))
+
+
+def _to_row(record):
+    return [
+        record["created"],
+        record["key"],
+        record["team"],
+        record["sheet"],
+        record["roster_version"],
+        record["seed"],
+        json.dumps(record["players"], ensure_ascii=False),
+        json.dumps(record["drivers"], ensure_ascii=False),
+        json.dumps({"assignments": record["assignments"], "capacities": record["capacities"]}, ensure_ascii=False),
+    ]
+
+
+def _from_row(row):
+    result = json.loads(row[8])
+    return {
+        "created": row[0],
+        "key": row[1],
+        "team": row[2],
+        "sheet": row[3],
+        "roster_version": row[4],
+        "seed": int(row[5]),
+        "players": json.loads(row[6]),
+        "drivers": json.loads(row[7]),
+        "assignments": result["assignments"],
+        "capacities": result["capacities"],
+    }
+
+
+class AssignmentStore:
+    """
+    Thread-safe LRU of assignment records backed by an append-only, batched history.
+
+    `write_rows(rows)` appends history rows. Buffered rows are written once there are
+    `batch_size` of them, or by the first put/get/recent after `flush_seconds` since
+    the last write. Write errors are logged and the rows retried `flush_seconds`
+    later. The owner calls close() when it drops the store; sessions still holding
+    it after that write each new result straight through.
+    """
+
+    def __init__(self, write_rows=None, batch_size=DEFAULT_BATCH_SIZE, flush_seconds=DEFAULT_FLUSH_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES, clock=time.monotonic):
+        self._write_rows = write_rows
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._records = OrderedDict()
+        self._pending = []
+        self._flushed_at = clock()
+        self._retry_at = 0  # No due flush before this after a failed write
+        self.closed = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @property
+    def persistent(self):
+        """
+        False for an in-memory store whose results are not written anywhere.
+        """
+        return self._write_rows is not None
+
+    def load(self, rows):
+        """
+        Warms the memo from history rows (header row excluded), oldest first.
+        """
+        with self._lock:
+            for row in rows[-self.max_entries:]:
+                try:
+                    record = _from_row(row)
+                except (IndexError, ValueError, KeyError):
+                    continue  # Hand-edited or truncated history line
+                self._remember(record)
+
+    def get(self, key):
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None:
+                self._records.move_to_end(key)
+        self._flush_if_due()
+        return record
+
+    def put(self, key, team, sheet, roster_version, seed, players, drivers, assignments, capacities):
+        record = {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "key": key,
+            "team": team,
+            "sheet": sheet,
+            "roster_version": roster_version,
+            "seed": seed,
+            "players": sorted(players),
+            "drivers": sorted(drivers),
+            "assignments": assignments,
+            "capacities": capacities,
+        }
+        with self._lock:
+            if key in self._records:
+                return self._records[key]  # Another session stored it first
+            self._remember(record)
+            self._pending.append(_to_row(record))
+        self._flush_if_due()
+        return record
+
+    def recent(self, sheet=None, limit=5):
+        """
+        Returns the most recently stored or used records, newest first.
+        """
+        with self._lock:
+            records = [r for r in reversed(self._records.values()) if sheet is None or r["sheet"] == sheet]
+        self._flush_if_due()
+        return records[:limit]
+
+    def flush(self):
+        """
+        Appends buffered history rows; rows are put back if the write fails.
+        """
+        with self._write_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+                self._flushed_at = self._clock()
+            if not rows or self._write_rows is None:
+                return 0
+            try:
+                self._write_rows(rows)
+            except Exception:
+                with self._lock:
+                    self._pending = rows + self._pending
+                raise
+            return len(rows)
+
+    def close(self):
+        """
+        Writes out buffered rows; later puts are written immediately instead of batched.
+        """
+        with self._lock:
+            self.closed = True
+        return self.flush()
+
+    def _flush_if_due(self):
+        with self._lock:
+            now = self._clock()
+            due = self._pending and now >= self._retry_at and (
+                self.closed or len(self._pending) >= self.batch_size or now - self._flushed_at >= self.flush_seconds
+            )
+        if not due:
+            return
+        try:
+            self.flush()
+        except Exception:
+            # ✅ The result is already memoized; a failed history write must not fail the caller
+            logger.exception("could not write %d assignment history rows", len(self._pending))
+            with self._lock:
+                self._retry_at = self._clock() + self.flush_seconds
+
+    def _remember(self, record):
+        self._records[record["key"]] = record
+        self._records.move_to_end(record["key"])
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+
+
+def get_or_assign(store, team_key, sheet_title, roster, players, drivers, grades, seed):
+    """
+    Returns the stored record for these inputs, running assign_cars and storing it only the first time.
+    """
+    key = assignment_key(team_key, sheet_title, roster.version, players, drivers, grades, seed)
+    record = store.get(key)
+    if record is None:
+        assignments, capacities = assign_cars(roster, players, drivers, grades, random.Random(seed))
+        record = store.put(key, team_key, sheet_title, roster.version, seed, players, drivers, assignments, capacities)
+    return record
+
+
+def read_jsonl(path):
+    """
+    Reads a local history file written by jsonl_writer (missing file = empty history).
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def jsonl_writer(path):
+    """
+    Returns a `write_rows` callable that appends history rows to a local JSONL file.
+    """
+    def write_rows(rows):
+        with open(path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return write_rows
@@ -0,0 +1,190 @@
+"""
+Streaming export of the Sheet1 ledger and the yearly settlement (年間精算) reports.
+
+The ledger is read in row-range chunks and written out as it streams, so memory
+stays bounded by the chunk size plus the per-driver/month totals:
+
+- 台帳: every ledger row (optionally one year only)
+- 年間集計: per-driver yearly totals
+- 月別集計: per-driver monthly totals
+- 未定: ledger rows whose toll is still 未定
+
+Each report is written as CSV, and all four as sheets of one Excel workbook
+(openpyxl, write-only mode). Used by the app's export panel and `fz_cli.py export`.
+"""
+import csv
+import os
+from collections import defaultdict
+
+from ledger import AMOUNT_COL, DATE_COL, LEDGER_COLUMNS, NAME_COL, NOTE_COL, PENDING_MARK, to_month
+
+DEFAULT_CHUNK_ROWS = 500
+
+REPORTS = {
+    "台帳": LEDGER_COLUMNS,
+    "年間集計": ["年", "名前", "金額", "件数", "未定件数"],
+    "月別集計": ["年-月", "名前", "金額", "件数", "未定件数"],
+    "未定": ["行"] + LEDGER_COLUMNS,
+}
+REPORT_FILES = {"台帳": "ledger", "年間集計": "yearly_totals", "月別集計": "monthly_totals", "未定": "pending"}
+
+
+def iter_worksheet_chunks(worksheet, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Yields (first_row_number, rows) for the ledger body, one A1 range request per chunk.
+
+    `row_count` comes from metadata fetched when the worksheet was opened and may predate
+    later appends, so reading continues past it until a chunk comes back empty.
+    """
+    last_column = chr(ord("A") + len(LEDGER_COLUMNS) - 1)
+    start = 2
+    while True:
+        rows = worksheet.get(f"A{start}:{last_column}{start + chunk_rows - 1}")
+        if rows:
+            yield start, rows
+        elif start + chunk_rows > worksheet.row_count:
+            return
+        start += chunk_rows
+
+
+def iter_csv_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Yields (first_row_number, rows) from a local Sheet1 CSV without loading it whole.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Header
+        chunk, start = [], 2
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) == chunk_rows:
+                yield start, chunk
+                start += len(chunk)
+                chunk = []
+        if chunk:
+            yield start, chunk
+
+
+def _cell(row, col):
+    return str(row[col]).strip() if len(row) > col else ""
+
+
+def _amount(value):
+    try:
+        return int(float(value))
+    except ValueError:
+        return 0
+
+
+class _Writers:
+    """
+    One CSV file per report plus an optional write-only Excel workbook.
+    """
+
+    def __init__(self, out_dir, formats, prefix):
+        self.paths = {}
+        self._files = []
+        self._csv = {}
+        self._sheets = {}
+        self._workbook = None
+
+        if "xlsx" in formats:
+            from openpyxl import Workbook  # Only needed for Excel output
+
+            self._workbook = Workbook(write_only=True)
+            for report, columns in REPORTS.items():
+                self._sheets[report] = self._workbook.create_sheet(report)
+                self._sheets[report].append(columns)
+            self.paths["xlsx"] = os.path.join(out_dir, f"{prefix}settlement.xlsx")
+
+        if "csv" in formats:
+            for report, columns in REPORTS.items():
+                path = os.path.join(out_dir, f"{prefix}{REPORT_FILES[report]}.csv")
+                f = open(path, "w", newline="", encoding="utf-8-sig")  # BOM so Excel opens Japanese text
+                self._files.append(f)
+                self._csv[report] = csv.writer(f)
+                self._csv[report].writerow(columns)
+                self.paths[f"{report}.csv"] = path
+
+    def write(self, report, row):
+        if report in self._csv:
+            self._csv[report].writerow(row)
+        if report in self._sheets:
+            self._sheets[report].append(row)
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        if self._workbook is not None:
+            self._workbook.save(self.paths["xlsx"])
+
+
+def write_settlement(chunks, out_dir, year=None, formats=("csv", "xlsx"), total_rows=None, progress=None):
+    """
+    Streams ledger chunks into the settlement reports under `out_dir`.
+
+    `chunks` yields (first_row_number, rows) as from iter_worksheet_chunks / iter_csv_chunks.
+    `progress(done_rows, total_rows)` is called after each chunk (total_rows may be None).
+    Returns {"paths": {...}, "rows": exported ledger rows, "pending": 未定 rows}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    writers = _Writers(out_dir, formats, prefix=f"{year}_" if year else "")
+    yearly = defaultdict(lambda: [0, 0, 0])  # (year, driver) -> [金額, 件数, 未定件数]
+    monthly = defaultdict(lambda: [0, 0, 0])  # (month, driver) -> [金額, 件数, 未定件数]
+    exported = pending = done = 0
+
+    try:
+        for start, rows in chunks:
+            for offset, row in enumerate(rows):
+                month = to_month(_cell(row, DATE_COL))
+                driver = _cell(row, NAME_COL)
+                if not month or not driver:
+                    continue  # Blank or malformed line
+                if year and not month.startswith(f"{year}-"):
+                    continue
+
+                cells = [_cell(row, col) for col in range(len(LEDGER_COLUMNS))]
+                is_pending = PENDING_MARK in cells[NOTE_COL]
+                amount = 0 if is_pending else _amount(cells[AMOUNT_COL])
+                if not is_pending:
+                    cells[AMOUNT_COL] = amount  # ✅ Numeric in Excel
+                writers.write("台帳", cells)
+                exported += 1
+
+                for totals in (yearly[(month[:4], driver)], monthly[(month, driver)]):
+                    totals[0] += amount
+                    totals[1] += 1
+                    totals[2] += is_pending
+
+                if is_pending:
+                    writers.write("未定", [start + offset] + cells)
+                    pending += 1
+
+            done += len(rows)
+            if progress:
+                progress(done, total_rows)
+
+        # ✅ Totals are O(drivers x months), so they are written once at the end
+        for (y, driver), (amount, count, pending_count) in sorted(yearly.items()):
+            writers.write("年間集計", [y, driver, amount, count, pending_count])
+        for (month, driver), (amount, count, pending_count) in sorted(monthly.items()):
+            writers.write("月別集計", [month, driver, amount, count, pending_count])
+    finally:
+        writers.close()
+
+    return {"paths": writers.paths, "rows": exported, "pending": pending}
+
+
+def export_worksheet(worksheet, out_dir, year=None, formats=("csv", "xlsx"),
+                     chunk_rows=DEFAULT_CHUNK_ROWS, progress=None):
+    """
+    Exports a live Sheet1 worksheet; row 1 is the header, the body is read in `chunk_rows` ranges.
+    """
+    return write_settlement(
+        iter_worksheet_chunks(worksheet, chunk_rows),
+        out_dir,
+        year=year,
+        formats=formats,
+        total_rows=max(worksheet.row_count - 1, 0),
+        progress=progress,
+    )
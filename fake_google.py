@@ -0,0 +1,209 @@
+"""
+In-process fakes for the Google Sheets (gspread) and Distance Matrix calls this app makes.
+
+Only the surface the app uses is implemented: `open_by_key`, `worksheet`,
+`worksheets`, `add_worksheet`, `get_all_values`, `get_all_records`, `get`,
+`col_values`, `row_count`, `append_rows`, `update`, `update_cell` and `distance_matrix`.
+Every call can be slowed down and can fail with HTTP 429, either at random or
+when a per-minute quota runs out, like the real APIs.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeAPIError(Exception):
+    """
+    Raised instead of gspread's APIError / googlemaps' ApiError; `code` is the HTTP status.
+    """
+
+    def __init__(self, code=429, message="RESOURCE_EXHAUSTED"):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.response = FakeResponse(code)
+
+
+class FakeService:
+    """
+    Latency and 429 injection shared by every fake object of one service.
+
+    `latency` and `jitter` are in seconds; `error_rate` is the probability of a random 429;
+    `quota_per_minute` (0 = unlimited) rejects calls beyond that many in any 60 s window.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, quota_per_minute=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota_per_minute = quota_per_minute
+        self._rng = random.Random(seed)
+        self._calls = deque()
+        self._lock = threading.Lock()
+        self.call_count = 0
+        self.error_count = 0
+
+    def call(self, name):
+        with self._lock:
+            self.call_count += 1
+            now = time.monotonic()
+            while self._calls and now - self._calls[0] > 60:
+                self._calls.popleft()
+            over_quota = self.quota_per_minute and len(self._calls) >= self.quota_per_minute
+            if not over_quota:
+                self._calls.append(now)
+            fail = over_quota or self._rng.random() < self.error_rate
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            if fail:
+                self.error_count += 1
+        time.sleep(delay)
+        if fail:
+            raise FakeAPIError(429, f"Quota exceeded for {name}")
+
+
+class FakeWorksheet:
+    def __init__(self, service, title, values):
+        self._service = service
+        self.title = title
+        self._values = [list(row) for row in values]
+        self._lock = threading.Lock()
+
+    def get_all_values(self):
+        self._service.call("get_all_values")
+        with self._lock:
+            return [[str(v) for v in row] for row in self._values]
+
+    def get_all_records(self):
+        self._service.call("get_all_records")
+        with self._lock:
+            header, rows = self._values[0], self._values[1:]
+            return [dict(zip(header, [_numericise(v) for v in row])) for row in rows]
+
+    @property
+    def row_count(self):
+        with self._lock:
+            return len(self._values)
+
+    def get(self, range_name):
+        """
+        Returns the rows of an "A2:F501"-style range (column letters are ignored).
+        """
+        self._service.call("get")
+        start, end = (int("".join(c for c in part if c.isdigit())) for part in range_name.split("!")[-1].split(":"))
+        with self._lock:
+            return [[str(v) for v in row] for row in self._values[start - 1:end]]
+
+    def col_values(self, col):
+        """
+        Returns column `col` (1-based) down to its last non-empty cell, like gspread.
+        """
+        self._service.call("col_values")
+        with self._lock:
+            column = [str(row[col - 1]) if len(row) >= col else "" for row in self._values]
+        while column and not column[-1]:
+            column.pop()
+        return column
+
+    def append_rows(self, values, value_input_option="RAW"):
+        self._service.call("append_rows")
+        with self._lock:
+            start = len(self._values) + 1
+            self._values.extend([list(row) for row in values])
+            end = len(self._values)
+        width = max((len(row) for row in values), default=1)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:{_column_letter(width)}{end}",
+                            "updatedRows": len(values)}}
+
+    def update(self, range_name, values):
+        """
+        Writes a block of rows starting at an "A1"-style cell (column A only).
+        """
+        self._service.call("update")
+        start = int("".join(c for c in range_name if c.isdigit()))
+        with self._lock:
+            while len(self._values) < start - 1 + len(values):
+                self._values.append([])
+            for offset, row in enumerate(values):
+                self._values[start - 1 + offset] = list(row)
+
+    def update_cell(self, row, col, value):
+        self._service.call("update_cell")
+        with self._lock:
+            while len(self._values) < row:
+                self._values.append([])
+            cells = self._values[row - 1]
+            cells.extend([""] * (col - len(cells)))
+            cells[col - 1] = value
+
+
+class FakeSpreadsheet:
+    def __init__(self, service, sheets):
+        self._service = service
+        self._worksheets = {title: FakeWorksheet(service, title, values) for title, values in sheets.items()}
+        self._lock = threading.Lock()
+
+    def worksheet(self, title):
+        return self._worksheets[title]
+
+    def worksheets(self):
+        self._service.call("worksheets")
+        with self._lock:
+            return list(self._worksheets.values())
+
+    def add_worksheet(self, title, rows, cols):
+        self._service.call("add_worksheet")
+        with self._lock:
+            return self._worksheets.setdefault(title, FakeWorksheet(self._service, title, []))
+
+
+class FakeGspreadClient:
+    """
+    Stand-in for an authorized gspread client: {sheet_id: {title: values}}.
+    """
+
+    def __init__(self, service, spreadsheets):
+        self._service = service
+        self._spreadsheets = {key: FakeSpreadsheet(service, sheets) for key, sheets in spreadsheets.items()}
+
+    def open_by_key(self, key):
+        self._service.call("open_by_key")
+        return self._spreadsheets[key]
+
+
+class FakeMapsClient:
+    """
+    Stand-in for googlemaps.Client; distances are stable per destination (2-60 km).
+    """
+
+    def __init__(self, service):
+        self._service = service
+
+    def distance_matrix(self, origins, destinations, mode="driving", avoid=None):
+        self._service.call("distance_matrix")
+        if isinstance(destinations, str):
+            destinations = [destinations]
+        elements = [
+            {"status": "OK", "distance": {"value": 2000 + (sum(map(ord, d)) * 7919) % 58000}}
+            for d in destinations
+        ]
+        return {"rows": [{"elements": elements}]}
+
+
+def _numericise(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _column_letter(n):
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
@@ -1,63 +1,145 @@
-import streamlit as st
-import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-from datetime import datetime
 import time
-import googlemaps
-import streamlit.components.v1 as components
+script_started = time.perf_counter()
+import streamlit as st
+from metrics import PhaseTimer
+from teams import load_teams
+
+timer = PhaseTimer(started=script_started)
+timer.mark("streamlit")
 
 st.set_page_config(page_title="Fz車アプリ", page_icon="🚗")
 
 # ==============================
 # 🚀 Secure Full-Screen Login System
 # ==============================
+# ⚠️ Keep everything above st.stop() Streamlit-only: heavy imports and remote clients
+#    are loaded below, on first authenticated use.
 
 USERNAME = st.secrets["app"]["username"]
 PASSWORD = st.secrets["app"]["password"]
 
+# ✅ One process serves every team in [teams] (see teams.py); the team is picked at login
+TEAMS = load_teams(st.secrets.get("teams"))
+
+def clear_export():
+    """
+    Deletes this session's last settlement export (files and download list).
+    """
+    import shutil
+
+    export_dir = st.session_state.pop("export_dir", None)
+    if export_dir:
+        shutil.rmtree(export_dir, ignore_errors=True)
+    st.session_state.pop("export_paths", None)
+
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
 
 if not st.session_state.logged_in:
     st.markdown("<div style='text-align:center'><h2>🔑 ログイン</h2></div>", unsafe_allow_html=True)
+    if len(TEAMS) > 1:
+        team_key = st.selectbox("チーム", list(TEAMS), format_func=lambda k: TEAMS[k].name, key="team_select")
+    else:
+        team_key = next(iter(TEAMS))
     entered_username = st.text_input("ユーザー名", value="", key="username")
     entered_password = st.text_input("パスワード", value="", type="password", key="password")
 
     if st.button("ログイン"):
-        if entered_username == USERNAME and entered_password == PASSWORD:
+        team = TEAMS[team_key]
+        if entered_username == (team.username or USERNAME) and entered_password == (team.password or PASSWORD):
+            if st.session_state.get("team_key") != team_key:
+                # ✅ Selections belong to the previous team's roster
+                for key in ("selected_drivers", "selected_players_tab2", "selected_drivers_tab2",
+                            "selected_players_tab3", "selected_drivers_tab3"):
+                    st.session_state.pop(key, None)
+                clear_export()  # ✅ Never offer the previous team's ledger for download
             st.session_state.logged_in = True
+            st.session_state.team_key = team_key
             st.experimental_rerun()
         else:
             st.error("🚫 ユーザー名またはパスワードが違います")
+    timer.mark("login_screen")  # ✅ Logged here, since st.stop() ends the run for visitors
     st.stop()
 
-# Load API Key from environment variables
-API_KEY = st.secrets["google_maps"]["api_key"]
+timer.mark("login")
 
-if not API_KEY:
-    raise ValueError("⚠️ Missing Google Maps API Key! Set GMAPS_API_KEY in environment variables.")
-
-# Initialize Google Maps client
-gmaps = googlemaps.Client(key=API_KEY)
+# ==============================
+# 📦 Deferred imports (only paid by logged-in users)
+# ==============================
+with timer.phase("imports"):
+    import atexit
+    import os
+    from datetime import datetime
+    import pandas as pd
+    import streamlit.components.v1 as components
+    from assignment import LOWER_GRADES, UPPER_GRADES, available_seats, format_assignment_text
+    from ledger import build_ledger_row
+    from pending_index import first_row_of_update
+    from metrics import deep_sizeof
+    from team_cache import TeamRegistry
+    from export import export_worksheet
+    from assignment_store import default_seed, get_or_assign
 
 # ==============================
-# ✅ Google Sheets Authentication (Using Streamlit Secrets)
+# ✅ Google clients, created once per process and shared by all sessions and teams
 # ==============================
 
-service_account_info = dict(st.secrets["google_credentials"])
+@st.cache_resource
+def get_gmaps(api_key):
+    """
+    Returns the Google Maps client for an API key; googlemaps is only imported when a distance is first needed.
+    """
+    import googlemaps
+
+    if not api_key:
+        raise ValueError("⚠️ Missing Google Maps API Key! Set GMAPS_API_KEY in environment variables.")
+    return googlemaps.Client(key=api_key)
+
+def maps_client_for(team):
+    # Load API Key from Streamlit secrets unless the team has its own
+    return get_gmaps(team.maps_api_key or st.secrets["google_maps"]["api_key"])
 
-service_account_info["private_key"] = service_account_info["private_key"].replace("\\n", "\n")
+@st.cache_resource
+def get_gspread_client():
+    """
+    Authenticates with the service account in Streamlit secrets.
+    """
+    import gspread
+    from google.oauth2.service_account import Credentials
 
-google_creds = dict(st.secrets["google_credentials"])  # ✅ Ensure it's a dictionary
-creds = Credentials.from_service_account_info(service_account_info, scopes=["https://www.googleapis.com/auth/spreadsheets"])
-client = gspread.authorize(creds)
+    service_account_info = dict(st.secrets["google_credentials"])  # ✅ Ensure it's a dictionary
+    service_account_info["private_key"] = service_account_info["private_key"].replace("\\n", "\n")
+    creds = Credentials.from_service_account_info(service_account_info, scopes=["https://www.googleapis.com/auth/spreadsheets"])
+    return gspread.authorize(creds)
 
-SHEET_ID = "1upehCYwnGEcKg_zVQG7jlnNUykFmvNbuAtnxzqvSEcA"
-spreadsheet = client.open_by_key(SHEET_ID)
-sheet1 = spreadsheet.worksheet("Sheet1")  # 🚗 車代管理
-sheet2 = spreadsheet.worksheet("Sheet2")  # 🎯 高：車両割り当て
-sheet3 = spreadsheet.worksheet("Sheet3")  # 🎯 低：車両割り当て
+@st.cache_resource
+def get_registry():
+    """
+    Per-team spreadsheets, roster snapshots, 未定 index and distance cache, with a shared memory budget.
+    Sessions only keep their team key and selection sets.
+    """
+    registry = TeamRegistry(
+        TEAMS,
+        open_spreadsheet=lambda sheet_id: get_gspread_client().open_by_key(sheet_id),
+        maps_client=maps_client_for,
+    )
+    atexit.register(registry.close_all)  # ✅ Write out batched assignment history on shutdown
+    return registry
+
+registry = get_registry()
+if registry.teams != TEAMS:
+    registry.set_teams(TEAMS)  # ✅ [teams] in secrets changed since the registry was created
+if st.session_state.get("team_key") not in registry.teams:
+    st.session_state.logged_in = False  # ✅ Team removed from config: back to login on the next click
+    st.error("⚠️ このチームの設定が見つかりません。もう一度ログインしてください。")
+    st.stop()
+
+team_ctx = registry.get(st.session_state.team_key)
+team = team_ctx.team
+
+with timer.phase("sheets"):
+    sheet1 = team_ctx.worksheet("Sheet1")  # 🚗 車代管理
+    pending_index = team_ctx.pending_index("Sheet1")
 
 # ==============================
 # 🔹 Create Tabs for Features
@@ -67,6 +149,8 @@ tab1, tab2, tab3 = st.tabs(["🚗 車代管理", "🎯 高：車両割り当て"
 # ---- TAB 1: 車代管理 (Your existing feature) ----
 with tab1:
     st.header("🚗 車代管理システム")
+    if len(TEAMS) > 1:
+        st.caption(f"チーム: {team.name}")
 
     # ==============================
     # Initialize Session State
@@ -89,50 +173,21 @@ with tab1:
         st.session_state.amount = 200  
     
     # ==============================
-    # Google Maps Distance Calculation
+    # Google Maps Distance Calculation (see reimbursement.py)
     # ==============================
     
-    BASE_LOCATION = "埼玉県和光市南1丁目5番10号"  # ⚠️ Change to your base location (e.g., your office)
-    
-    def get_distance(destination):
+    def lookup_distance(destination):
         """
-        Returns the driving distance in kilometers from BASE_LOCATION to the destination.
+        Returns the driving distance in kilometers from the team's base location, or None after showing the error.
         """
-        BASE_LOCATION = "埼玉県和光市南1丁目5番10号"  # ✅ Change to your actual base location
-        
         try:
-            result = gmaps.distance_matrix(
-                origins=BASE_LOCATION,
-                destinations=destination,
-                mode="driving",
-                avoid="tolls",
-            )
-            distance_meters = result["rows"][0]["elements"][0]["distance"]["value"]
-            distance_km = distance_meters / 1000  # Convert meters to km
-            return distance_km
+            distance_km = team_ctx.distance(destination)  # ✅ Cached per team
         except Exception as e:
             st.error(f"エラー: {e}")
             return None
-    
-    def calculate_reimbursement(distance_km):
-        """
-        Returns the reimbursement amount based on distance.
-        ⚠️ Modify tiers based on your reimbursement policy.
-        """
-        if distance_km < 5:
-            return 200
-        elif distance_km < 10:
-            return 400
-        elif distance_km < 20:
-            return 600
-        elif distance_km < 30:
-            return 800
-        elif distance_km < 40:
-            return 1000
-        elif distance_km < 50:
-            return 1200
-        else:
-            return 1500
+        if distance_km is None:
+            st.error("エラー: 距離を取得できませんでした")
+        return distance_km
     
     
     # ==============================
@@ -142,8 +197,7 @@ with tab1:
     
     st.session_state.date = st.date_input("試合日を選択してください", value=st.session_state.date)
     
-    driver_list = ["平野", "ケイン", "山﨑", "萩原", "仙波し", "仙波ち", "久保", "落合", "浜島", "野波",
-                   "末田", "芳本", "鈴木", "山田", "佐久間", "今井", "西川"]
+    driver_list = team.drivers
     
     st.write("### 運転手を選択してください")
     
@@ -173,9 +227,9 @@ with tab1:
     
         if st.button("距離を計算"):
             if destination:
-                distance = get_distance(destination)
+                distance = lookup_distance(destination)
                 if distance is not None:
-                    reimbursement = calculate_reimbursement(distance)
+                    reimbursement = team_ctx.reimbursement(distance)  # ✅ Team's tier table
                     st.session_state.amount = reimbursement
                     st.session_state.distance = distance  # ✅ Save calculated distance persistently
                     st.success(f"🚗 距離: {distance:.1f} km")
@@ -227,38 +281,24 @@ with tab1:
     
             new_entries = []
             for driver in st.session_state.selected_drivers:
-                # ✅ Set defaults properly
-                one_way = st.session_state.one_way.get(driver, False)
-                toll_round_trip = st.session_state.toll_round_trip.get(driver, False)
-                toll_one_way = st.session_state.toll_one_way.get(driver, False)
-    
-                # ✅ Ensure toll_cost is handled properly
-                toll_cost = st.session_state.toll_cost.get(driver, "0")  
-                toll_cost_numeric = pd.to_numeric(toll_cost, errors="coerce")
-                toll_cost = int(toll_cost_numeric) if not pd.isna(toll_cost_numeric) else "未定"
-    
-                # ✅ Compute amount correctly
-                amount = st.session_state.amount  
-                if one_way:  
-                    amount /= 2  
-                if toll_round_trip:  
-                    amount = toll_cost  
-                elif toll_one_way:  
-                    amount = (st.session_state.amount / 2) + (toll_cost if toll_cost != "未定" else 0)  
-    
-                # ✅ Ensure "補足" (Notes) correctly saves "未定"
-                supplement = "未定" if toll_cost == "未定" else ""
-    
-                new_entries.append([
-                    game_date, 
+                # ✅ Amount, 高速道路 and "補足" (未定) rules live in ledger.build_ledger_row
+                new_entries.append(build_ledger_row(
+                    game_date,
                     driver,
-                    int(amount) if toll_cost != "未定" else "未定", 
-                    "あり" if toll_round_trip or toll_one_way else "なし", 
-                    supplement,
+                    st.session_state.amount,
                     timestamp,
-                ])
-    
-            sheet1.append_rows(new_entries, value_input_option="USER_ENTERED")
+                    one_way=st.session_state.one_way.get(driver, False),
+                    toll_round_trip=st.session_state.toll_round_trip.get(driver, False),
+                    toll_one_way=st.session_state.toll_one_way.get(driver, False),
+                    toll_cost=st.session_state.toll_cost.get(driver, "0"),
+                ))
+    
+            response = sheet1.append_rows(new_entries, value_input_option="USER_ENTERED")
+            start_row = first_row_of_update(response)
+            if start_row is not None:
+                pending_index.record_append(start_row, new_entries)  # ✅ Track new 未定 rows without rescanning
+            else:
+                pending_index.rebuild(sheet1.get_all_values())
             st.session_state.last_submission_id = timestamp # Store last submission
             st.success("✅ データが保存されました！")
             st.rerun()
@@ -289,7 +329,14 @@ with tab1:
     # ==============================
     st.header("📊 月ごとの集計")
     
-    df = pd.DataFrame(sheet1.get_all_records())
+    ledger_values = sheet1.get_all_values()
+    df = pd.DataFrame(ledger_values[1:], columns=ledger_values[0]) if len(ledger_values) > 1 else pd.DataFrame()
+    
+    # ✅ The index is shared by every session and can go stale when Sheet1 is sorted or edited by hand,
+    #    or when 未定 rows arrive from elsewhere: compare it with this download (no extra API call)
+    missing_pending, stale_pending = pending_index.check(ledger_values)
+    if missing_pending or stale_pending:
+        pending_index.rebuild(ledger_values)
     
     if df.empty:
         st.warning("データがありません。")
@@ -297,11 +344,8 @@ with tab1:
         df["年-月"] = pd.to_datetime(df["日付"]).dt.strftime("%Y-%m")
         df["金額"] = pd.to_numeric(df["金額"], errors="coerce").fillna(0).astype(int)
     
-        # ✅ Ensure "補足" column exists before checking for "未定"
-        if "補足" in df.columns:
-            df["未定フラグ"] = df["補足"].apply(lambda x: "未定" in str(x))
-        else:
-            df["未定フラグ"] = False  # Default to False if "補足" column is missing
+        # ✅ (month, driver) pairs with 未定 rows come from the index, not a scan of "補足"
+        pending_keys = pending_index.pending_keys()
     
         # ✅ Create a summary table
         pivot_summary = df.pivot_table(index="年-月", columns="名前", values="金額", aggfunc="sum", fill_value=0)
@@ -317,9 +361,7 @@ with tab1:
     
         for col in styled_df.columns:
             for index, value in styled_df[col].items():
-                # ✅ Correctly filter df to check if "未定" exists for that driver and month
-                filtered_df = df[(df["年-月"] == index) & (df["名前"] == col)]
-                is_pending = filtered_df["未定フラグ"].any() if not filtered_df.empty else False
+                is_pending = (index, col) in pending_keys
     
                 # ✅ Apply formatting for "未定" cells **after** determining is_pending
                 def format_cell(value, is_pending):
@@ -351,30 +393,77 @@ with tab1:
     
     # ✅ Update Google Sheets when "更新" button is clicked
     if st.button("未定だった高速料金を更新", key="update_pending"):
-        if len(updated_values) > 0:  # ✅ Ensure `updated_values` exists before proceeding
-            all_records = sheet1.get_all_values()
-    
-            for i, row in enumerate(all_records):
-                if i == 0:
-                    continue  # ✅ Skip headers
-    
-                # ✅ Extract and clean up data from the row
-                row_date_clean = pd.to_datetime(row[0], errors="coerce").strftime("%Y-%m")  # Convert Google Sheets date to YYYY-MM
-                row_driver_clean = row[1].strip()  # ✅ Extract driver name
-              
-                for (index, col), new_value in updated_values.items():
-                    formatted_index_clean = pd.to_datetime(index, errors="coerce").strftime("%Y-%m")  # Ensure comparison is YYYY-MM
-    
-                    # ✅ Compare cleaned values
-                    if row_date_clean == formatted_index_clean and row_driver_clean == col:
-                        # ✅ Update 金額 column
-                        sheet1.update_cell(i + 1, 3, new_value)  # ✅ Update "金額" (Column C)
-                        sheet1.update_cell(i + 1, 5, "")  # ✅ Clear "補足" (Column E)
+        # ✅ Only the 未定 rows for each month and driver, looked up in the index
+        rows_to_update = {key: pending_index.rows_for(*key) for key in updated_values}
+        if len(updated_values) == 0:
+            st.warning("🚨 変更された値がありません。更新するには値を入力してください。")
+        elif stale_pending:
+            # ✅ Never write to row numbers the sheet no longer agrees with
+            st.error("⚠️ シートの行が変更されていたため、更新を中止しました。表を確認してもう一度入力してください。")
+        else:
+            for (index, col), new_value in updated_values.items():
+                rows = rows_to_update[(index, col)]
+                for row in rows:
+                    sheet1.update_cell(row, 3, new_value)  # ✅ Update "金額" (Column C)
+                    sheet1.update_cell(row, 5, "")  # ✅ Clear "補足" (Column E)
+                pending_index.resolve(rows)
             
             st.success("✅ 高速料金が更新されました！")
             st.rerun()  # ✅ Instant refresh to update the displayed table
+    
+    # ==============================
+    # ⏳ Outstanding 未定 tolls (from the index)
+    # ==============================
+    with st.expander(f"⏳ 未定の高速料金一覧（{len(pending_index)}件）"):
+        pending_entries = pending_index.entries()
+        if pending_entries:
+            st.table([
+                {"行": e.row, "年-月": e.month, "名前": e.driver, "ID": e.submission_id}
+                for e in pending_entries
+            ])
         else:
-            st.warning("🚨 変更された値がありません。更新するには値を入力してください。")
+            st.write("未定の高速料金はありません。")
+    
+        # ✅ Consistency check result for this run (the index was rebuilt above if needed)
+        if missing_pending or stale_pending:
+            st.warning(f"⚠️ インデックスを再構築しました（追加 {len(missing_pending)}件・削除 {len(stale_pending)}件）")
+    
+    # ==============================
+    # 📤 Yearly settlement export (streamed in row chunks, see export.py)
+    # ==============================
+    with st.expander("📤 年間精算エクスポート"):
+        this_year = datetime.today().year
+        export_year = st.selectbox("対象年", [this_year, this_year - 1, this_year - 2, None],
+                                   format_func=lambda y: f"{y}年" if y else "全期間", key="export_year")
+    
+        export_clicked = st.button("📤 エクスポート", key="run_export")
+        if export_clicked:
+            import tempfile
+    
+            clear_export()  # ✅ One export directory per session at a time
+            progress_bar = st.progress(0.0, text="エクスポート中...")
+    
+            def report_progress(done, total):
+                progress_bar.progress(min(done / total, 1.0) if total else 0.0, text=f"エクスポート中... {done}行")
+    
+            out_dir = tempfile.mkdtemp(prefix="fz_export_")  # ✅ Files stay on disk, not in session state
+            st.session_state.export_dir = out_dir
+            try:
+                result = export_worksheet(sheet1, out_dir, year=export_year, progress=report_progress)
+            except ImportError:
+                st.warning("⚠️ openpyxl がないため CSV のみ出力します。")
+                result = export_worksheet(sheet1, out_dir, year=export_year, formats=("csv",), progress=report_progress)
+            progress_bar.progress(1.0, text=f"✅ {result['rows']}行（未定 {result['pending']}件）")
+            st.session_state.export_paths = result["paths"]
+    
+        # ✅ download_button holds the whole file, so files are only read right after an export or
+        #    when asked for again, not on every rerun of the app
+        export_paths = st.session_state.get("export_paths", {})
+        if export_paths and (export_clicked or st.button("⬇️ ダウンロードを表示", key="show_export_downloads")):
+            for label, path in export_paths.items():
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        st.download_button(f"⬇️ {label}", f, file_name=os.path.basename(path), key=f"download_{label}")
     
     # ==============================
     # ✅ Logout & Reset Button (Moved to the bottom)
@@ -388,18 +477,70 @@ with tab1:
         st.session_state.toll_round_trip.clear()
         st.session_state.toll_one_way.clear()
         st.session_state.toll_cost.clear()
+        clear_export()
         st.success("✅ ログアウトしました。")
         st.rerun()
     
-# ---- TAB 2: 車両割り当て (New Player-to-Car Assignment) ----
-if "sheet2_data" not in st.session_state:
-    st.session_state["sheet2_data"] = sheet2.get_all_values()
-    st.session_state["last_fetch_time_tab2"] = time.time()
+timer.mark("tab1")
 
-df_sheet2 = pd.DataFrame(
-    st.session_state["sheet2_data"][1:], 
-    columns=st.session_state["sheet2_data"][0]
-)
+# ==============================
+# 💾 Stored assignments (shared by all sessions of the team, see assignment_store.py)
+# ==============================
+def stored_assignment(sheet_title, roster, selected_players, selected_drivers, grades, seed):
+    """
+    Returns the stored result for these inputs, computing and storing it only the first time.
+    """
+    # ✅ The store (and the 割り当て履歴 sheet) is only opened on the first assignment
+    store = team_ctx.assignment_store()
+    if not store.persistent:
+        st.warning("⚠️ 割り当て履歴シートを開けないため、結果はこのサーバーのメモリにのみ保存されます。")
+    # ✅ Parent-child first, grade-aware round-robin, no single-kid cars (see assignment.py)
+    return get_or_assign(store, team.key, sheet_title, roster, selected_players, selected_drivers, grades, seed)
+
+def stored_record(key):
+    store = team_ctx.assignment_store(create=False)
+    return store.get(key) if store else None
+
+def render_assignment(record):
+    st.subheader("📝 割り当て結果")
+    st.caption(f"💾 {record['created']} 保存 · シード {record['seed']} · キー {record['key']}")
+    for driver, players in record["assignments"].items():
+        st.markdown(f"🚗 **{driver}カー** ({record['capacities'][driver]}人乗り)")
+        for player in players:
+            st.write(f"- {player}")
+
+    # ✅ Preserve formatting for clipboard copying
+    assignment_text = format_assignment_text(record["assignments"], record["capacities"])
+
+    # ✅ Escape backticks and backslashes for JavaScript
+    escaped_assignment_text = assignment_text.replace("\\", "\\\\").replace("`", "\\`")
+
+    # ✅ JavaScript Copy Button (Only shows after results are generated)
+    if assignment_text.strip():
+        copy_script = f"""
+        <script>
+        function copyToClipboard() {{
+            navigator.clipboard.writeText(`{escaped_assignment_text}`).then(() => {{
+                alert("結果がクリップボードにコピーされました！");
+            }});
+        }}
+        </script>
+        <button onclick="copyToClipboard()">📋 結果をコピー</button>
+        """
+        components.html(copy_script, height=50)
+
+def render_recent_assignments(sheet_title):
+    with st.expander("🕘 最近の割り当て（全員で共有）"):
+        store = team_ctx.assignment_store(create=False)
+        recent = store.recent(sheet_title) if store else []
+        if not recent:
+            st.write("まだ割り当てはありません。")
+        for record in recent:
+            st.caption(f"{record['created']} · シード {record['seed']} · キー {record['key']}")
+            st.code(format_assignment_text(record["assignments"], record["capacities"]), language=None)
+
+# ---- TAB 2: 車両割り当て (New Player-to-Car Assignment) ----
+roster_tab2 = team_ctx.roster("Sheet2")
 
 with tab2:
     st.header("🎯 車両割り当てシステム")
@@ -409,12 +550,11 @@ with tab2:
     if "selected_players_tab2" not in st.session_state:
         st.session_state.selected_players_tab2 = set()
 
-    if not df_sheet2.empty:
-        players = df_sheet2[['名前', '学年', '親']].dropna().to_dict(orient="records")
+    if roster_tab2.names:
 
      # ✅ FIXED: Properly working "全員選択" button
         if st.button("全員選択", key="select_all_players_tab2"):
-            st.session_state.selected_players_tab2 = {p["名前"] for p in players}
+            st.session_state.selected_players_tab2 = set(roster_tab2.names)
             st.rerun()  # ✅ Force UI refresh to immediately reflect changes
 
         with st.form(key="player_selection_form_tab2"):
@@ -422,16 +562,16 @@ with tab2:
             temp_selected_players_tab2 = set()  # ✅ Temporary local storage
             player_columns = st.columns(2)
     
-            for i, player in enumerate(players):
+            for i, (player_name, grade) in enumerate(zip(roster_tab2.names, roster_tab2.grades)):
                 with player_columns[i % 2]:
-                    key = f"player_tab2_{player['名前'].replace(' ', '_')}"
-                    checked = player["名前"] in st.session_state.selected_players_tab2
-                    new_checked = st.checkbox(f"{player['名前']}（{player['学年']}年）", value=checked, key=key)
+                    key = f"player_tab2_{player_name.replace(' ', '_')}"
+                    checked = player_name in st.session_state.selected_players_tab2
+                    new_checked = st.checkbox(f"{player_name}（{grade}年）", value=checked, key=key)
 
                     if new_checked:
-                        temp_selected_players_tab2.add(player["名前"])
+                        temp_selected_players_tab2.add(player_name)
                     else:
-                        temp_selected_players_tab2.discard(player["名前"])
+                        temp_selected_players_tab2.discard(player_name)
 
             # ✅ This button submits the form (script only re-runs here)
             submitted = st.form_submit_button("✅ 出席を確定する")
@@ -446,24 +586,23 @@ with tab2:
     if "selected_drivers_tab2" not in st.session_state:
         st.session_state.selected_drivers_tab2 = set()
 
-    if not df_sheet2.empty:
-        drivers = [d for d in df_sheet2[['運転手', '定員']].dropna().to_dict(orient="records") if d["運転手"] and d["定員"]]
+    if roster_tab2.drivers:
 
         with st.form(key="driver_selection_form_tab2"):
             st.subheader("⚾️ 運転手確認（チェックを入れてください）")
             temp_selected_drivers_tab2 = set()  # ✅ Temporary local storage
             driver_columns = st.columns(2)
 
-            for i, driver in enumerate(drivers):
+            for i, (driver_name, capacity) in enumerate(zip(roster_tab2.drivers, roster_tab2.capacities)):
                 with driver_columns[i % 2]:
-                    key = f"driver_tab2_{driver['運転手'].replace(' ', '_')}_{i}"
-                    checked = driver['運転手'] in st.session_state.selected_drivers_tab2
-                    new_checked = st.checkbox(f"{driver['運転手']}（{driver['定員']}人乗り）", value=checked, key=key)
+                    key = f"driver_tab2_{driver_name.replace(' ', '_')}_{i}"
+                    checked = driver_name in st.session_state.selected_drivers_tab2
+                    new_checked = st.checkbox(f"{driver_name}（{capacity}人乗り）", value=checked, key=key)
     
                     if new_checked:
-                        temp_selected_drivers_tab2.add(driver['運転手'])
+                        temp_selected_drivers_tab2.add(driver_name)
                     else:
-                        temp_selected_drivers_tab2.discard(driver['運転手'])  # ✅ Ensure unchecked drivers are removed
+                        temp_selected_drivers_tab2.discard(driver_name)  # ✅ Ensure unchecked drivers are removed
 
             # ✅ This button submits the form (script only re-runs here)
             submitted = st.form_submit_button("✅ 運転手を確定する")
@@ -478,6 +617,7 @@ with tab2:
     if st.button("🧹 クリア", key="clear_tab2"):
         st.session_state.selected_players_tab2.clear()
         st.session_state.selected_drivers_tab2.clear()
+        st.session_state.pop("last_assignment_tab2", None)
         st.rerun()
 
     def check_seat_availability(total_players, available_seats):
@@ -486,135 +626,42 @@ with tab2:
             st.stop()  # Stop execution to prevent further processing
     
     # ---- 自動割り当てボタン ----
+    seed_tab2 = st.number_input("🎲 シード（同じ選択・同じシードなら同じ結果。変えると別の組み合わせ）",
+                                value=default_seed(), step=1, key="seed_tab2")
     if st.button("🖱️ 自動割り当て", key="assign_tab2"):
-        if "sheet2_data" not in st.session_state or st.session_state["sheet2_data"] is None:
-            sheet2_data = sheet2.get_all_values()
-            st.session_state["sheet2_data"] = sheet2_data
-            st.session_state["last_fetch_time_tab2"] = time.time()
     
         if not st.session_state.selected_players_tab2 or not st.session_state.selected_drivers_tab2:
             st.warning("⚠️ 選手と運転手を選択・確定してください。")
         else:
-            df_sheet2 = pd.DataFrame(
-                st.session_state["sheet2_data"][1:], 
-                columns=st.session_state["sheet2_data"][0]
-            ) if st.session_state["sheet2_data"] else pd.DataFrame(columns=["名前", "学年", "運転手", "定員", "親"])
-    
-            selected_player_list = list(st.session_state.selected_players_tab2)
-            selected_driver_list = list(st.session_state.selected_drivers_tab2)
-    
-            # ✅ Define total players
-            total_players = len(selected_player_list)
-    
-            # ✅ Calculate available seats before assignment
-            available_seats = sum(int(df_sheet2[df_sheet2["運転手"] == driver]["定員"].values[0]) 
-                                  for driver in selected_driver_list if driver in df_sheet2["運転手"].values)
-    
             # ✅ Check if there are enough seats
-            check_seat_availability(total_players, available_seats)
-
-            # ✅ Organize players by grade
-            player_grades_tab2 = {p["名前"]: int(p["学年"]) for p in players if p["名前"] in selected_player_list}
-            grade_5 = [p for p in selected_player_list if player_grades_tab2.get(p) == 5]
-            grade_6 = [p for p in selected_player_list if player_grades_tab2.get(p) == 6]
-            import random
-            random.shuffle(grade_5)  # ✅ Shuffle 5th graders separately
-            random.shuffle(grade_6)  # ✅ Shuffle 6th graders separately
-            player_queue_tab2 = grade_5 + grade_6  # ✅ Combine after shuffling
-
-            # ✅ Sort drivers by capacity (largest first)
-            driver_capacities_tab2 = {d['運転手']: int(d['定員']) for d in drivers if d['運転手'] in selected_driver_list}
-            sorted_drivers_tab2 = sorted(driver_capacities_tab2.items(), key=lambda x: x[1], reverse=True)
-
-            # ✅ Assign parent-child first and determine grade preference
-            player_parents_tab2 = {p["名前"]: p["親"] for p in players if p["名前"] in selected_player_list and p.get("親") and p["親"] in selected_driver_list}
-            assignments_tab2 = {driver: [] for driver, _ in sorted_drivers_tab2}
-            car_grade_preference_tab2 = {}
-
-            for player, parent in player_parents_tab2.items():
-                if parent in assignments_tab2 and player in player_queue_tab2:
-                    assignments_tab2[parent].append(player)
-                    car_grade_preference_tab2[parent] = player_grades_tab2[player]  # ✅ Determine the preferred grade level
-                    player_queue_tab2.remove(player)
-
-            # ✅ Step 2: Grade-Aware Round-Robin Assignment
-            driver_seats_tab2 = {driver: capacity - len(assignments_tab2[driver]) for driver, capacity in sorted_drivers_tab2}
-
-            while player_queue_tab2:
-                sorted_available_drivers = sorted(driver_seats_tab2.items(), key=lambda x: x[1], reverse=True)
-                for driver, available_seats in sorted_available_drivers:
-                    if available_seats > 0 and player_queue_tab2:
-                        preferred_grade = car_grade_preference_tab2.get(driver, None)
-
-                        # ✅ Try to assign a player of the preferred grade first
-                        assigned = False
-                        for player in player_queue_tab2:
-                            if preferred_grade and player_grades_tab2[player] == preferred_grade:
-                                assignments_tab2[driver].append(player)
-                                driver_seats_tab2[driver] -= 1
-                                player_queue_tab2.remove(player)
-                                assigned = True
-                                break
-
-                        # ✅ If no preferred grade players left, assign any remaining player
-                        if not assigned and player_queue_tab2:
-                            assignments_tab2[driver].append(player_queue_tab2.pop(0))
-                            driver_seats_tab2[driver] -= 1
-
-            # ✅ Step 3: Prevent Single-Kid Cars
-            single_kid_cars_tab2 = [d for d, p in assignments_tab2.items() if len(p) == 1]
-            multi_kid_cars_tab2 = [d for d, p in assignments_tab2.items() if len(p) >= 3]
-
-            if single_kid_cars_tab2 and multi_kid_cars_tab2:
-                for single_car in single_kid_cars_tab2:
-                    for multi_car in multi_kid_cars_tab2:
-                        if len(assignments_tab2[multi_car]) > 2:
-                            moved_player = assignments_tab2[multi_car].pop()
-                            assignments_tab2[single_car].append(moved_player)
-                            break
-
-            assignments_tab2 = {driver: players for driver, players in assignments_tab2.items() if players}
-
-            # ✅ Step 4: Copy to Clipboard Button (Only Appears After Assignment)
-
-            st.subheader("📝 割り当て結果")
-            assignment_lines = []
-            for driver, players in assignments_tab2.items():
-                st.markdown(f"🚗 **{driver}カー** ({driver_capacities_tab2[driver]}人乗り)")
-                assignment_lines.append(f"🚗 {driver} の車 ({driver_capacities_tab2[driver]}人乗り)")
-                for player in players:
-                    st.write(f"- {player}")
-                    assignment_lines.append(f"- {player}")
-
-            # ✅ Preserve formatting for clipboard copying
-            assignment_text = "\n".join(assignment_lines)
-            
-            # ✅ Escape backticks and backslashes for JavaScript
-            escaped_assignment_text = assignment_text.replace("\\", "\\\\").replace("`", "\\`")
-
-            # ✅ JavaScript Copy Button (Only shows after results are generated)
-            if assignment_text.strip():
-                copy_script = f"""
-                <script>
-                function copyToClipboard() {{
-                    navigator.clipboard.writeText(`{escaped_assignment_text}`).then(() => {{
-                        alert("結果がクリップボードにコピーされました！");
-                    }});
-                }}
-                </script>
-                <button onclick="copyToClipboard()">📋 結果をコピー</button>
-                """
-                components.html(copy_script, height=50)
+            check_seat_availability(
+                len(st.session_state.selected_players_tab2),
+                available_seats(roster_tab2.driver_capacities(), st.session_state.selected_drivers_tab2),
+            )
 
-# ---- TAB 3: 車両割り当て (New Player-to-Car Assignment) ----
-if "sheet3_data" not in st.session_state:
-    st.session_state["sheet3_data"] = sheet3.get_all_values()
-    st.session_state["last_fetch_time_tab3"] = time.time()
+            # ✅ Same players, drivers, roster and seed → the stored result, without recomputing
+            record_tab2 = stored_assignment(
+                "Sheet2",
+                roster_tab2,
+                st.session_state.selected_players_tab2,
+                st.session_state.selected_drivers_tab2,
+                UPPER_GRADES,
+                int(seed_tab2),
+            )
+            st.session_state.last_assignment_tab2 = record_tab2["key"]
 
-df_sheet3 = pd.DataFrame(
-    st.session_state["sheet3_data"][1:], 
-    columns=st.session_state["sheet3_data"][0]
-)
+    # ✅ Step 4: Result stays visible across reruns (only its key is kept in the session)
+    if st.session_state.get("last_assignment_tab2"):
+        record_tab2 = stored_record(st.session_state.last_assignment_tab2)
+        if record_tab2:
+            render_assignment(record_tab2)
+
+    render_recent_assignments("Sheet2")
+
+timer.mark("tab2")
+
+# ---- TAB 3: 車両割り当て (New Player-to-Car Assignment) ----
+roster_tab3 = team_ctx.roster("Sheet3")
     
 with tab3:
     st.header("🎯 車両割り当てシステム")
@@ -623,12 +670,11 @@ with tab3:
     if "selected_players_tab3" not in st.session_state:
         st.session_state.selected_players_tab3 = set()
 
-    if not df_sheet3.empty:
-        players_tab3 = df_sheet3[['名前', '学年', '親']].dropna().to_dict(orient="records")
+    if roster_tab3.names:
 
         # ✅ FIXED: Properly working "全員選択" button
         if st.button("全員選択", key="select_all_players_tab3"):
-            st.session_state.selected_players_tab3 = {p["名前"] for p in players_tab3}
+            st.session_state.selected_players_tab3 = set(roster_tab3.names)
             st.rerun()  # ✅ Force UI refresh to immediately reflect changes
 
         with st.form(key="player selection form tab3"):
@@ -636,15 +682,15 @@ with tab3:
             temp_selected_players_tab3 = set() # Temporary local storage
             player_columns = st.columns(2)
 
-            for i, player in enumerate(players_tab3):
+            for i, (player_name, grade) in enumerate(zip(roster_tab3.names, roster_tab3.grades)):
                 with player_columns[i % 2]:
-                    key = f"player_tab3_{player['名前'].replace(' ', '_')}"
-                    new_checked = st.checkbox(f"{player['名前']}（{player['学年']}年）", value=player["名前"] in st.session_state.selected_players_tab3, key=key)
+                    key = f"player_tab3_{player_name.replace(' ', '_')}"
+                    new_checked = st.checkbox(f"{player_name}（{grade}年）", value=player_name in st.session_state.selected_players_tab3, key=key)
     
                     if new_checked:
-                        temp_selected_players_tab3.add(player['名前'])
+                        temp_selected_players_tab3.add(player_name)
                     else:
-                        temp_selected_players_tab3.discard(player['名前'])
+                        temp_selected_players_tab3.discard(player_name)
 
             # This button submits the form (script only re-runs here)
             submitted = st.form_submit_button("✅ 出席を確定する")
@@ -659,29 +705,28 @@ with tab3:
     if "selected_drivers_tab3" not in st.session_state:
         st.session_state.selected_drivers_tab3 = set()
 
-    if not df_sheet3.empty:
-        drivers_tab3 = [d for d in df_sheet3[['運転手', '定員']].dropna().to_dict(orient="records") if d["運転手"] and d["定員"]]
+    if roster_tab3.drivers:
 
         with st.form(key="driver_selection_form_tab3"):
             st.subheader("🚘 運転手（チェックを入れてください）")
             temp_selected_drivers_tab3 = set() # Temporary local storage
             driver_columns = st.columns(2)
             
-            for i, driver in enumerate(drivers_tab3):
+            for i, (driver_name, capacity) in enumerate(zip(roster_tab3.drivers, roster_tab3.capacities)):
                 with driver_columns[i % 2]:
-                    key = f"driver_tab3_{driver['運転手'].replace(' ', '_')}_{i}"
-                    checked = driver['運転手'] in st.session_state.selected_drivers_tab3
-                    new_checked = st.checkbox(f"{driver['運転手']}（{driver['定員']}人乗り）", value=checked, key=key)
+                    key = f"driver_tab3_{driver_name.replace(' ', '_')}_{i}"
+                    checked = driver_name in st.session_state.selected_drivers_tab3
+                    new_checked = st.checkbox(f"{driver_name}（{capacity}人乗り）", value=checked, key=key)
     
                     if new_checked:
-                        temp_selected_drivers_tab3.add(driver['運転手'])
+                        temp_selected_drivers_tab3.add(driver_name)
                     else:
-                        temp_selected_drivers_tab3.discard(driver['運転手'])
+                        temp_selected_drivers_tab3.discard(driver_name)
             
             # This button submits the form (script only re-runs here)
             submitted = st.form_submit_button("✅ 運転手を確定する")
             if submitted:
-                st.session_state.selected_players_tab3 = temp_selected_players_tab3.copy()
+                st.session_state.selected_drivers_tab3 = temp_selected_drivers_tab3.copy()
                 st.success("✅ 運転手が保存されました！")
 
     else:
@@ -691,6 +736,7 @@ with tab3:
     if st.button("🧹 クリア", key="clear_tab3"):
         st.session_state.selected_players_tab3.clear()
         st.session_state.selected_drivers_tab3.clear()
+        st.session_state.pop("last_assignment_tab3", None)
         st.rerun()
 
     def check_seat_availability(total_players, available_seats):
@@ -699,130 +745,40 @@ with tab3:
             st.stop()  # Stop execution to prevent further processing
 
     # ---- 自動割り当てボタン ----
+    seed_tab3 = st.number_input("🎲 シード（同じ選択・同じシードなら同じ結果。変えると別の組み合わせ）",
+                                value=default_seed(), step=1, key="seed_tab3")
     if st.button("🖱️ 自動割り当て", key="assign_tab3"):
-        if "sheet3_data" not in st.session_state or st.session_state["sheet3_data"] is None:
-            sheet3_data = sheet3.get_all_values()
-            st.session_state["sheet3_data"] = sheet3_data
-            st.session_state["last_fetch_time_tab3"] = time.time()
 
         if not st.session_state.selected_players_tab3 or not st.session_state.selected_drivers_tab3:
             st.warning("⚠️ 選手と運転手を選択してください。")
             
         else:
-            df_sheet3 = pd.DataFrame(
-                st.session_state["sheet3_data"][1:], 
-                columns=st.session_state["sheet3_data"][0]
-            ) if st.session_state["sheet3_data"] else pd.DataFrame(columns=["名前", "学年", "運転手", "定員", "親"])
+            # ✅ Check if there are enough seats
+            check_seat_availability(
+                len(st.session_state.selected_players_tab3),
+                available_seats(roster_tab3.driver_capacities(), st.session_state.selected_drivers_tab3),
+            )
 
-            selected_player_list = list(st.session_state.selected_players_tab3)
-            selected_driver_list = list(st.session_state.selected_drivers_tab3)
+            # ✅ Same players, drivers, roster and seed → the stored result, without recomputing
+            record_tab3 = stored_assignment(
+                "Sheet3",
+                roster_tab3,
+                st.session_state.selected_players_tab3,
+                st.session_state.selected_drivers_tab3,
+                LOWER_GRADES,
+                int(seed_tab3),
+            )
+            st.session_state.last_assignment_tab3 = record_tab3["key"]
 
-            # ✅ Define total players
-            total_players = len(selected_player_list)
-    
-            # ✅ Calculate available seats before assignment
-            available_seats = sum(int(df_sheet3[df_sheet3["運転手"] == driver]["定員"].values[0]) 
-                                  for driver in selected_driver_list if driver in df_sheet3["運転手"].values)
-    
-            # ✅ Check if there are enough seats
-            check_seat_availability(total_players, available_seats)
-
-            # ✅ Organize players by grade
-            player_grades_tab3 = {p["名前"]: int(p["学年"]) for p in players_tab3 if p["名前"] in selected_player_list}
-            grade_1 = [p for p in selected_player_list if player_grades_tab3.get(p) == 1]
-            grade_2 = [p for p in selected_player_list if player_grades_tab3.get(p) == 2]
-            grade_3 = [p for p in selected_player_list if player_grades_tab3.get(p) == 3]
-            grade_4 = [p for p in selected_player_list if player_grades_tab3.get(p) == 4]
-            import random
-            random.shuffle(grade_1)  # ✅ Shuffle 1st graders separately
-            random.shuffle(grade_2)  # ✅ Shuffle 2nd graders separately
-            random.shuffle(grade_3)  # ✅ Shuffle 3rd graders separately
-            random.shuffle(grade_4)  # ✅ Shuffle 4th graders separately
-            player_queue_tab3 = grade_1 + grade_2 + grade_3 + grade_4  # ✅ Maintain order by grade
-
-            # ✅ Sort drivers by capacity (largest first)
-            driver_capacities_tab3 = {d['運転手']: int(d['定員']) for d in drivers_tab3 if d['運転手'] in selected_driver_list}
-            sorted_drivers_tab3 = sorted(driver_capacities_tab3.items(), key=lambda x: x[1], reverse=True)
-
-            # ✅ Assign parent-child first and determine grade preference
-            player_parents_tab3 = {p["名前"]: p["親"] for p in players_tab3 if p["名前"] in selected_player_list and p.get("親") and p["親"] in selected_driver_list}
-            assignments_tab3 = {driver: [] for driver, _ in sorted_drivers_tab3}
-            car_grade_preference_tab3 = {}
-
-            for player, parent in player_parents_tab3.items():
-                if parent in assignments_tab3 and player in player_queue_tab3:
-                    assignments_tab3[parent].append(player)
-                    car_grade_preference_tab3[parent] = player_grades_tab3[player]  # ✅ Determine the preferred grade level
-                    player_queue_tab3.remove(player)
-
-            # ✅ Step 2: Grade-Aware Round-Robin Assignment
-            driver_seats_tab3 = {driver: capacity - len(assignments_tab3[driver]) for driver, capacity in sorted_drivers_tab3}
-
-            while player_queue_tab3:
-                sorted_available_drivers = sorted(driver_seats_tab3.items(), key=lambda x: x[1], reverse=True)
-                for driver, available_seats in sorted_available_drivers:
-                    if available_seats > 0 and player_queue_tab3:
-                        preferred_grade = car_grade_preference_tab3.get(driver, None)
-
-                        # ✅ Try to assign a player of the preferred grade first
-                        assigned = False
-                        for player in player_queue_tab3:
-                            if preferred_grade and player_grades_tab3[player] == preferred_grade:
-                                assignments_tab3[driver].append(player)
-                                driver_seats_tab3[driver] -= 1
-                                player_queue_tab3.remove(player)
-                                assigned = True
-                                break
-
-                        # ✅ If no preferred grade players left, assign any remaining player
-                        if not assigned and player_queue_tab3:
-                            assignments_tab3[driver].append(player_queue_tab3.pop(0))
-                            driver_seats_tab3[driver] -= 1
-                          
-            # ✅ Step 3: Prevent Single-Kid Cars
-            single_kid_cars_tab3 = [d for d, p in assignments_tab3.items() if len(p) == 1]
-            multi_kid_cars_tab3 = [d for d, p in assignments_tab3.items() if len(p) >= 3]
-
-            if single_kid_cars_tab3 and multi_kid_cars_tab3:
-                for single_car in single_kid_cars_tab3:
-                    for multi_car in multi_kid_cars_tab3:
-                        if len(assignments_tab3[multi_car]) > 2:
-                            moved_player = assignments_tab3[multi_car].pop()
-                            assignments_tab3[single_car].append(moved_player)
-                            break
-
-            assignments_tab3 = {driver: players for driver, players in assignments_tab3.items() if players}
-
-            # ✅ Step 4: Copy to Clipboard Button (Only Appears After Assignment)
-
-            st.subheader("📝 割り当て結果")
-            assignment_lines = []
-            for driver, players in assignments_tab3.items():
-                st.markdown(f"🚗 **{driver}カー** ({driver_capacities_tab3[driver]}人乗り)")
-                assignment_lines.append(f"🚗 {driver} の車 ({driver_capacities_tab3[driver]}人乗り)")
-                for player in players:
-                    st.write(f"- {player}")
-                    assignment_lines.append(f"- {player}")
-
-            # ✅ Preserve formatting for clipboard copying
-            assignment_text = "\n".join(assignment_lines)
-            
-            # ✅ Escape backticks and backslashes for JavaScript
-            escaped_assignment_text = assignment_text.replace("\\", "\\\\").replace("`", "\\`")
-
-            # ✅ JavaScript Copy Button (Only shows after results are generated)
-            if assignment_text.strip():
-                copy_script = f"""
-                <script>
-                function copyToClipboard() {{
-                    navigator.clipboard.writeText(`{escaped_assignment_text}`).then(() => {{
-                        alert("結果がクリップボードにコピーされました！");
-                    }});
-                }}
-                </script>
-                <button onclick="copyToClipboard()">📋 結果をコピー</button>
-                """
-                components.html(copy_script, height=50)
+    # ✅ Step 4: Result stays visible across reruns (only its key is kept in the session)
+    if st.session_state.get("last_assignment_tab3"):
+        record_tab3 = stored_record(st.session_state.last_assignment_tab3)
+        if record_tab3:
+            render_assignment(record_tab3)
+
+    render_recent_assignments("Sheet3")
+
+timer.mark("tab3")
 
 st.markdown(
     """
@@ -836,3 +792,22 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+# ==============================
+# ⏱ Startup / rerun timing per phase
+# ==============================
+with st.sidebar.expander("⏱ 起動時間"):
+    st.table(timer.report())
+    st.caption(f"合計: {timer.total() * 1000:.0f} ms（cold_ms = このプロセスでの初回）")
+
+# ==============================
+# 🧠 Memory: per-session state vs. shared roster snapshots
+# ==============================
+with st.sidebar.expander("🧠 メモリ"):
+    st.table([
+        {"対象": "このセッション", "KB": round(deep_sizeof(st.session_state.to_dict()) / 1024, 1)},
+        {"対象": f"共有 Sheet2 名簿 ({roster_tab2.version})", "KB": round(deep_sizeof(roster_tab2) / 1024, 1)},
+        {"対象": f"共有 Sheet3 名簿 ({roster_tab3.version})", "KB": round(deep_sizeof(roster_tab3) / 1024, 1)},
+    ])
+    st.caption(f"チーム別キャッシュ（上限 {registry.max_bytes // 1024} KB）")
+    st.table(registry.stats())
@@ -0,0 +1,267 @@
+"""
+Headless command-line entry point for batch jobs and benchmarks.
+
+Runs the same assignment, reimbursement and summary logic as the Streamlit app
+without importing Streamlit, and writes JSON (default) or CSV.
+
+    python fz_cli.py assign --roster sheet2.csv --players 太郎,次郎 --drivers 平野,久保 --grades 5,6 --seed 1
+    python fz_cli.py reimburse --trips trips.csv
+    python fz_cli.py summary --ledger sheet1.csv
+    python fz_cli.py export --sheet-id ID --credentials sa.json --year 2024 --out-dir settlement
+
+Local files may be CSV or a JSON dump of `get_all_values()`. Alternatively pass
+--sheet-id with --credentials (service-account JSON) to read the live worksheet.
+Distances use the GMAPS_API_KEY environment variable unless trips carry 距離.
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import random
+import sys
+
+import assignment
+import assignment_store
+import export
+import ledger
+import reimbursement
+import roster
+from metrics import PhaseTimer
+from teams import DEFAULT_TEAM
+
+
+def _split(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+
+def load_values(path, sheet_id, credentials, worksheet):
+    """
+    Returns `get_all_values()`-shaped rows from a local file or the live worksheet.
+    """
+    if path:
+        return roster.read_values(path)
+    return open_worksheet(sheet_id, credentials, worksheet).get_all_values()
+
+
+def open_worksheet(sheet_id, credentials, worksheet):
+    if not (sheet_id and credentials):
+        raise SystemExit("error: pass a local file or --sheet-id with --credentials")
+    import gspread  # Only needed for live sheets
+    client = gspread.service_account(filename=credentials)
+    return client.open_by_key(sheet_id).worksheet(worksheet)
+
+
+def cmd_assign(args):
+    values = load_values(args.roster, args.sheet_id, args.credentials, args.worksheet)
+    snapshot = roster.Roster.from_values(values)
+
+    selected_players = set(_split(args.players)) or set(snapshot.names)
+    selected_drivers = set(_split(args.drivers)) or set(snapshot.drivers)
+
+    seats = assignment.available_seats(snapshot.driver_capacities(), selected_drivers)
+    if len(selected_players) > seats:
+        raise SystemExit(f"error: {len(selected_players)} players but only {seats} seats")
+
+    # ✅ Same grade split as the app's tabs: Sheet3 is the 低学年 roster
+    default_grades = assignment.LOWER_GRADES if args.worksheet == "Sheet3" else assignment.UPPER_GRADES
+    grades = tuple(int(g) for g in _split(args.grades)) or default_grades
+    if args.store:
+        # ✅ Same inputs as a stored run → the stored result; new results are appended to the JSONL history
+        store = assignment_store.AssignmentStore(write_rows=assignment_store.jsonl_writer(args.store))
+        store.load(assignment_store.read_jsonl(args.store))
+        seed = args.seed if args.seed is not None else assignment_store.default_seed()
+        record = assignment_store.get_or_assign(
+            store, args.team, args.worksheet, snapshot, selected_players, selected_drivers, grades, seed
+        )
+        store.flush()
+        assignments, car_capacities, key = record["assignments"], record["capacities"], record["key"]
+    else:
+        rng = random.Random(args.seed)
+        assignments, car_capacities = assignment.assign_cars(snapshot, selected_players, selected_drivers, grades, rng)
+        key = ""
+    rows = [
+        {"運転手": driver, "定員": car_capacities[driver], "選手": player, "キー": key}
+        for driver, car in assignments.items() for player in car
+    ]
+
+    # ✅ assign_cars skips players outside `grades` (or not in the roster): list them and fail the run
+    unassigned = sorted(set(selected_players) - {row["選手"] for row in rows})
+    if unassigned:
+        rows.extend({"運転手": "", "定員": "", "選手": player, "キー": key, "エラー": "未割り当て"} for player in unassigned)
+        print(f"error: {len(unassigned)} players not assigned (grades {','.join(map(str, grades))}): "
+              f"{','.join(unassigned)}", file=sys.stderr)
+        args.exit_code = 1
+    return rows
+
+
+def _flag(row, column):
+    return str(row.get(column, "")).strip().lower() in ("1", "true", "yes", "あり", "○")
+
+
+def cmd_reimburse(args):
+    values = roster.read_values(args.trips)
+    header = values[0] if values else []
+    trips = [dict(zip(header, row)) for row in values[1:]]
+
+    # ✅ One batched Distance Matrix lookup per unique venue that lacks a 距離
+    need_lookup = [t["目的地"].strip() for t in trips if t.get("目的地", "").strip() and not str(t.get("距離", "")).strip()]
+    distances = {}
+    if need_lookup:
+        api_key = os.environ.get("GMAPS_API_KEY")
+        if not api_key:
+            raise SystemExit("error: set GMAPS_API_KEY or provide a 距離 column")
+        import googlemaps  # Only needed when distances must be looked up
+        gmaps = googlemaps.Client(key=api_key)
+        distances = reimbursement.get_distances(gmaps, need_lookup, args.origin)
+
+    submission_id = time.strftime("%Y%m%d%H%M%S")
+    results = []
+    for trip in trips:
+        destination = trip.get("目的地", "").strip()
+        given = str(trip.get("距離", "")).strip()
+        if not (destination or given):
+            results.append({"目的地": "", "名前": trip.get("名前", ""), "距離": None, "エラー": "目的地も距離もありません"})
+            continue
+        try:
+            distance = float(given) if given else distances.get(destination)
+        except ValueError:
+            results.append({"目的地": destination, "名前": trip.get("名前", ""), "距離": given, "エラー": "距離が数値ではありません"})
+            continue
+        if distance is None:
+            results.append({"目的地": destination, "名前": trip.get("名前", ""), "距離": None, "エラー": "距離を取得できませんでした"})
+            continue
+        base_amount = reimbursement.calculate_reimbursement(distance)
+        row = ledger.build_ledger_row(
+            trip.get("日付", ""),
+            trip.get("名前", ""),
+            base_amount,
+            submission_id,
+            one_way=_flag(trip, "一般道路片道"),
+            toll_round_trip=_flag(trip, "高速道路往復"),
+            toll_one_way=_flag(trip, "高速道路片道"),
+            toll_cost=trip.get("高速料金", "") or "0",
+        )
+        result = dict(zip(ledger.LEDGER_COLUMNS, row))
+        result.update({"目的地": destination, "距離": round(distance, 1), "車代": base_amount})
+        results.append(result)
+    return results
+
+
+def cmd_summary(args):
+    values = load_values(args.ledger, args.sheet_id, args.credentials, args.worksheet)
+    summary = ledger.monthly_summary(values)
+    return [
+        {"年-月": month, "名前": driver, "金額": cell["金額"], "未定": cell[ledger.PENDING_MARK]}
+        for (month, driver), cell in sorted(summary.items())
+    ]
+
+
+def cmd_export(args):
+    formats = tuple(_split(args.formats))
+    if "xlsx" in formats and importlib.util.find_spec("openpyxl") is None:
+        # ✅ Same fallback as the app: CSV only when openpyxl isn't installed
+        formats = tuple(f for f in formats if f != "xlsx")
+        if not formats:
+            raise SystemExit("error: xlsx output needs openpyxl (pip install openpyxl)")
+        print("warning: openpyxl is not installed; writing CSV only", file=sys.stderr)
+
+    def progress(done, total):
+        print(f"export: {done}/{total or '?'} rows", file=sys.stderr)
+
+    if args.ledger:
+        result = export.write_settlement(
+            export.iter_csv_chunks(args.ledger, args.chunk_rows), args.out_dir,
+            year=args.year, formats=formats, progress=progress,
+        )
+    else:
+        result = export.export_worksheet(
+            open_worksheet(args.sheet_id, args.credentials, args.worksheet), args.out_dir,
+            year=args.year, formats=formats, chunk_rows=args.chunk_rows, progress=progress,
+        )
+    return [{"rows": result["rows"], "pending": result["pending"], **result["paths"]}]
+
+
+def write_output(rows, fmt, out):
+    if fmt == "csv":
+        columns = list(dict.fromkeys(k for row in rows for k in row))
+        writer = csv.DictWriter(out, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        json.dump(rows, out, ensure_ascii=False, indent=2)
+        out.write("\n")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="fz_cli", description="Fz車アプリ batch tools")
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument("--output", help="write to this file instead of stdout")
+    parser.add_argument("--timing", action="store_true", help="report elapsed time on stderr")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_sheet_args(p, default_worksheet):
+        p.add_argument("--sheet-id")
+        p.add_argument("--credentials", help="service-account JSON file")
+        p.add_argument("--worksheet", default=default_worksheet)
+
+    p = sub.add_parser("assign", help="自動割り当て from a roster")
+    p.add_argument("--roster", help="roster CSV/JSON (名前, 学年, 親, 運転手, 定員)")
+    p.add_argument("--players", help="comma-separated players (default: everyone)")
+    p.add_argument("--drivers", help="comma-separated drivers (default: everyone)")
+    p.add_argument("--grades", help="comma-separated grades (default: 1-4 for Sheet3, else 5,6)")
+    p.add_argument("--seed", type=int, help="default: random, or today's YYYYMMDD with --store")
+    p.add_argument("--store", help="JSONL assignment history to reuse and append to")
+    p.add_argument("--team", default=DEFAULT_TEAM.key, help="team key used in the store key")
+    add_sheet_args(p, "Sheet2")
+    p.set_defaults(func=cmd_assign)
+
+    p = sub.add_parser("reimburse", help="distances and 車代 for many trips")
+    p.add_argument("--trips", required=True,
+                   help="CSV/JSON with 日付, 目的地, 名前 and optional 距離, 一般道路片道, 高速道路往復, 高速道路片道, 高速料金")
+    p.add_argument("--origin", default=reimbursement.BASE_LOCATION)
+    p.set_defaults(func=cmd_reimburse)
+
+    p = sub.add_parser("summary", help="monthly totals per driver")
+    p.add_argument("--ledger", help="Sheet1 CSV/JSON")
+    add_sheet_args(p, "Sheet1")
+    p.set_defaults(func=cmd_summary)
+
+    p = sub.add_parser("export", help="年間精算 reports (CSV/Excel), streamed in row chunks")
+    p.add_argument("--ledger", help="Sheet1 CSV (streamed; JSON not supported)")
+    p.add_argument("--year", type=int, help="only this year (default: all rows)")
+    p.add_argument("--out-dir", default="export")
+    p.add_argument("--formats", default="csv,xlsx")
+    p.add_argument("--chunk-rows", type=int, default=export.DEFAULT_CHUNK_ROWS)
+    add_sheet_args(p, "Sheet1")
+    p.set_defaults(func=cmd_export)
+    return parser
+
+
+def main(argv=None):
+    timer = PhaseTimer(started=STARTED)
+    timer.mark("imports")
+    args = build_parser().parse_args(argv)
+    with timer.phase(args.command):
+        rows = args.func(args)
+
+    with timer.phase("output"):
+        if args.output:
+            with open(args.output, "w", newline="", encoding="utf-8") as out:
+                write_output(rows, args.format, out)
+        else:
+            write_output(rows, args.format, sys.stdout)
+
+    if args.timing:
+        for phase in timer.report():
+            print(f"{phase['phase']}: {phase['ms']} ms", file=sys.stderr)
+        print(f"{args.command}: {len(rows)} rows in {timer.total() * 1000:.1f} ms total", file=sys.stderr)
+    return getattr(args, "exit_code", 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
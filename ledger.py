@@ -0,0 +1,96 @@
+"""
+Sheet1 (車代管理) ledger rows: building new entries and monthly summaries.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+LEDGER_COLUMNS = ["日付", "名前", "金額", "高速道路", "補足", "ID"]
+
+# Sheet1 column positions (0-based)
+DATE_COL = 0
+NAME_COL = 1
+AMOUNT_COL = 2
+TOLL_COL = 3
+NOTE_COL = 4
+ID_COL = 5
+
+PENDING_MARK = "未定"
+
+_DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S")
+
+
+def to_month(value):
+    """
+    Returns the YYYY-MM month for a ledger date cell, or "" if it can't be parsed.
+    """
+    text = str(value).strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m")
+        except ValueError:
+            continue
+    return ""
+
+
+def parse_toll_cost(value):
+    """
+    Returns the toll cost as an int, or "未定" if it isn't a number yet.
+    """
+    try:
+        return int(float(str(value).strip()))
+    except ValueError:
+        return PENDING_MARK
+
+
+def build_ledger_row(game_date, driver, base_amount, submission_id,
+                     one_way=False, toll_round_trip=False, toll_one_way=False, toll_cost="0"):
+    """
+    Returns one Sheet1 row for a driver, applying the one-way and toll rules.
+    """
+    toll_cost = parse_toll_cost(toll_cost)
+
+    amount = base_amount
+    if one_way:
+        amount /= 2
+    if toll_round_trip:
+        amount = toll_cost
+    elif toll_one_way:
+        amount = (base_amount / 2) + (toll_cost if toll_cost != PENDING_MARK else 0)
+
+    return [
+        game_date,
+        driver,
+        int(amount) if toll_cost != PENDING_MARK else PENDING_MARK,
+        "あり" if toll_round_trip or toll_one_way else "なし",
+        PENDING_MARK if toll_cost == PENDING_MARK else "",
+        submission_id,
+    ]
+
+
+def _cell(row, col):
+    return str(row[col]).strip() if len(row) > col else ""
+
+
+def _amount(value):
+    try:
+        return int(float(value))
+    except ValueError:
+        return 0
+
+
+def monthly_summary(values):
+    """
+    Totals 金額 per (YYYY-MM, driver) from `get_all_values()`-shaped rows (header first).
+    Returns {(month, driver): {"金額": total, "未定": bool}}; 未定 amounts count as 0.
+    """
+    summary = defaultdict(lambda: {"金額": 0, PENDING_MARK: False})
+    for row in values[1:]:
+        month = to_month(_cell(row, DATE_COL))
+        driver = _cell(row, NAME_COL)
+        if not month or not driver:
+            continue
+        cell = summary[(month, driver)]
+        cell["金額"] += _amount(_cell(row, AMOUNT_COL))
+        if PENDING_MARK in _cell(row, NOTE_COL):
+            cell[PENDING_MARK] = True
+    return dict(summary)
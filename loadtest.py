@@ -0,0 +1,254 @@
+"""
+Load test: N concurrent parent sessions against fake Sheets / Maps services.
+
+Each simulated session walks the app's path — login, 出席確認, 運転手確認,
+自動割り当て, 距離を計算 and 送信 — through the same modules the app uses
+(TeamRegistry, Roster, AssignmentStore, build_ledger_row, PendingIndex). Like a
+Streamlit rerun, every step also repeats the app's per-rerun reads (see rerun()).
+
+rerun() only models the remote calls and shared caches. Widget rendering, the
+pandas pivot/HTML of the 月ごとの集計 and Streamlit's own overhead are not
+included, so the numbers are a lower bound for what the real script costs.
+
+    python loadtest.py --sessions 30 --latency-ms 150 --jitter-ms 100 --error-rate 0.02
+
+Prints throughput and p50/p95/p99 latency per step (JSON with --json).
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from assignment import UPPER_GRADES, available_seats
+from assignment_store import get_or_assign
+from fake_google import FakeGspreadClient, FakeMapsClient, FakeService
+from ledger import LEDGER_COLUMNS, build_ledger_row
+from pending_index import first_row_of_update
+from team_cache import TeamRegistry
+from teams import DEFAULT_TEAM, Team
+
+USERNAME = "coach"
+PASSWORD = "password"
+STEPS = ("login", "select_players", "select_drivers", "assign", "distance", "submit")
+VENUES = ("霞第十小学校", "和光市総合体育館", "朝霞中央公園", "新座市民球場", "志木市運動場")
+
+
+def make_roster(players, drivers, rng):
+    rows = [["名前", "学年", "親", "運転手", "定員"]]
+    driver_names = [f"運転手{i}" for i in range(drivers)]
+    for i in range(max(players, drivers)):
+        rows.append([
+            f"選手{i}" if i < players else "",
+            str(rng.choice(UPPER_GRADES)) if i < players else "",
+            driver_names[i] if i < drivers and rng.random() < 0.5 else "",
+            driver_names[i] if i < drivers else "",
+            str(rng.choice((4, 5, 6, 7))) if i < drivers else "",
+        ])
+    return rows
+
+
+def make_teams(count):
+    if count == 1:
+        return {DEFAULT_TEAM.key: DEFAULT_TEAM}
+    return {f"team{i}": Team(key=f"team{i}", name=f"Team {i}", sheet_id=f"sheet-{i}") for i in range(count)}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, step, seconds):
+        with self._lock:
+            self.latencies[step].append(seconds)
+
+    def error(self, step, exc):
+        with self._lock:
+            self.errors[f"{step}: {type(exc).__name__} {getattr(exc, 'code', '')}".strip()] += 1
+
+
+def rerun(registry, team_key):
+    """
+    The remote reads every Streamlit rerun makes before the clicked action: team context,
+    Sheet1 for the 月ごとの集計 (checking the 未定 index against it) and both rosters.
+    """
+    ctx = registry.get(team_key)
+    sheet1 = ctx.worksheet("Sheet1")
+    pending_index = ctx.pending_index("Sheet1")
+    ledger_values = sheet1.get_all_values()
+    missing, stale = pending_index.check(ledger_values)
+    if missing or stale:
+        pending_index.rebuild(ledger_values)
+    pending_index.pending_keys()
+    ctx.roster("Sheet3")
+    return ctx, ctx.roster("Sheet2")
+
+
+def run_session(n, registry, team_keys, recorder, seed):
+    rng = random.Random(seed + n)
+    team_key = team_keys[n % len(team_keys)]
+    state = {}
+
+    def login():
+        team = registry.teams[team_key]
+        if (team.username or USERNAME, team.password or PASSWORD) != (USERNAME, PASSWORD):
+            raise RuntimeError(f"team {team_key} has its own login")
+        rerun(registry, team_key)
+
+    def select_players():
+        _, roster = rerun(registry, team_key)
+        state["players"] = set(rng.sample(roster.names, k=max(1, int(len(roster.names) * 0.8))))
+
+    def select_drivers():
+        _, roster = rerun(registry, team_key)
+        drivers = list(roster.drivers)
+        rng.shuffle(drivers)
+        selected, seats = set(), 0
+        for driver in drivers:
+            if seats >= len(state["players"]):
+                break
+            selected.add(driver)
+            seats += roster.capacity_of(driver)
+        state["drivers"] = selected
+
+    def assign():
+        ctx, roster = rerun(registry, team_key)
+        if len(state["players"]) <= available_seats(roster.driver_capacities(), state["drivers"]):
+            state["assignment"] = get_or_assign(ctx.assignment_store(), team_key, "Sheet2", roster,
+                                                state["players"], state["drivers"], UPPER_GRADES, seed)
+
+    def distance():
+        ctx, _ = rerun(registry, team_key)
+        state["amount"] = ctx.reimbursement(ctx.distance(rng.choice(VENUES)))
+
+    def submit():
+        ctx, _ = rerun(registry, team_key)
+        submission_id = f"{time.strftime('%Y%m%d%H%M%S')}{n:04d}"
+        toll = rng.random() < 0.2
+        entries = [
+            build_ledger_row(date.today().isoformat(), driver, state["amount"], submission_id,
+                             toll_one_way=toll, toll_cost="未定" if toll else "0")
+            for driver in sorted(state["drivers"])
+        ]
+        sheet1 = ctx.worksheet("Sheet1")
+        response = sheet1.append_rows(entries, value_input_option="USER_ENTERED")
+        start_row = first_row_of_update(response)
+        if start_row is not None:
+            ctx.pending_index("Sheet1").record_append(start_row, entries)
+        else:
+            ctx.pending_index("Sheet1").rebuild(sheet1.get_all_values())
+        rerun(registry, team_key)  # st.rerun() after 送信
+
+    started = time.perf_counter()
+    for step, action in zip(STEPS, (login, select_players, select_drivers, assign, distance, submit)):
+        t0 = time.perf_counter()
+        try:
+            action()
+        except Exception as exc:  # ✅ 429s and bugs alike end the session, never the whole run
+            recorder.error(step, exc)
+            return False
+        recorder.record(step, time.perf_counter() - t0)
+    recorder.record("session", time.perf_counter() - started)
+    return True
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] * 1000 if samples else 0.0
+        return {"p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49] * 1000, "p95": cuts[94] * 1000, "p99": cuts[98] * 1000}
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    sheets_service = FakeService(args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate,
+                                 args.quota_per_minute, seed=args.seed)
+    maps_service = FakeService(args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate, seed=args.seed)
+
+    teams = make_teams(args.teams)
+    spreadsheets = {
+        team.sheet_id: {
+            "Sheet1": [LEDGER_COLUMNS],
+            "Sheet2": make_roster(args.players, args.drivers, rng),
+            "Sheet3": make_roster(args.players, args.drivers, rng),
+        }
+        for team in teams.values()
+    }
+    gspread_client = FakeGspreadClient(sheets_service, spreadsheets)
+    maps_client = FakeMapsClient(maps_service)
+    registry = TeamRegistry(teams, gspread_client.open_by_key, lambda team: maps_client)
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency or args.sessions) as pool:
+        results = list(pool.map(
+            lambda n: run_session(n, registry, list(teams), recorder, args.seed), range(args.sessions)
+        ))
+    registry.close_all()  # Flush batched assignment history
+    elapsed = time.perf_counter() - started
+
+    completed = sum(results)
+    return {
+        "sessions": args.sessions,
+        "completed": completed,
+        "failed": args.sessions - completed,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_sessions_per_s": round(completed / elapsed, 2) if elapsed else 0.0,
+        "sheets_calls": sheets_service.call_count,
+        "maps_calls": maps_service.call_count,
+        "errors": dict(recorder.errors),
+        "latency_ms": {
+            step: {k: round(v, 1) for k, v in percentiles(recorder.latencies[step]).items()}
+            for step in STEPS + ("session",) if recorder.latencies[step]
+        },
+    }
+
+
+def print_report(report):
+    print(f"sessions: {report['completed']}/{report['sessions']} completed in {report['elapsed_s']} s "
+          f"({report['throughput_sessions_per_s']} sessions/s)")
+    print(f"API calls: sheets={report['sheets_calls']} maps={report['maps_calls']}")
+    for error, count in report["errors"].items():
+        print(f"error: {error} x{count}")
+    print(f"{'step':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for step, p in report["latency_ms"].items():
+        print(f"{step:<16}{p['p50']:>10}{p['p95']:>10}{p['p99']:>10}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="loadtest", description="Concurrent-session load test with fake Google APIs")
+    parser.add_argument("--sessions", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=0, help="worker threads (default: one per session)")
+    parser.add_argument("--teams", type=int, default=1)
+    parser.add_argument("--players", type=int, default=24)
+    parser.add_argument("--drivers", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a random 429 per call")
+    parser.add_argument("--quota-per-minute", type=int, default=0, help="Sheets calls per minute before 429 (0 = off)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = run(args)
+    if args.json:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_report(report)
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
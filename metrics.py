@@ -0,0 +1,81 @@
+"""
+Lightweight startup/phase timing for the app and the CLI (no third-party imports).
+"""
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# First (cold) duration seen for each phase in this process; later reruns hit warm caches
+COLD_START = {}
+
+
+class PhaseTimer:
+    """
+    Records how long each named phase of a script run takes.
+    """
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self._last = self.started
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def mark(self, name):
+        """
+        Records the time since the previous phase ended (or since the timer started).
+        """
+        self.record(name, time.perf_counter() - self._last)
+
+    def record(self, name, seconds):
+        self._last = time.perf_counter()
+        self.phases.append((name, seconds))
+        COLD_START.setdefault(name, seconds)
+        logger.info("phase %s: %.1f ms", name, seconds * 1000)
+
+    def report(self):
+        """
+        Returns one row per phase with this run's and the cold-start time in ms.
+        """
+        return [
+            {"phase": name, "ms": round(seconds * 1000, 1), "cold_ms": round(COLD_START[name] * 1000, 1)}
+            for name, seconds in self.phases
+        ]
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    Approximate memory footprint of `obj` in bytes, following containers and slots.
+    Objects reachable twice are counted once.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict) or (hasattr(obj, "items") and hasattr(obj, "keys")):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+    return size
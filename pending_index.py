@@ -0,0 +1,124 @@
+"""
+Index of pending-toll (未定) rows in the Sheet1 ledger.
+
+The index keeps one entry per ledger row whose 補足 column contains 未定, so the
+app can list and resolve outstanding tolls by row number. It is updated when rows
+are appended or resolved; the app also checks it against the Sheet1 download it
+already makes for the 月ごとの集計 on every rerun, and rebuilds it on any
+difference (rows sorted, deleted or edited by hand, 未定 rows added elsewhere).
+"""
+import re
+import threading
+from collections import namedtuple
+
+from ledger import DATE_COL, ID_COL, NAME_COL, NOTE_COL, PENDING_MARK, to_month
+
+PendingEntry = namedtuple("PendingEntry", ["row", "month", "driver", "submission_id"])
+
+_RANGE_START = re.compile(r"![A-Z]+(\d+)")
+
+
+def first_row_of_update(response):
+    """
+    Returns the first sheet row written by `append_rows`, from its API response.
+    """
+    try:
+        updated_range = response["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    match = _RANGE_START.search(updated_range)
+    return int(match.group(1)) if match else None
+
+
+def _cell(row, col):
+    return str(row[col]).strip() if len(row) > col else ""
+
+
+def _entry_for(row_number, row):
+    if PENDING_MARK not in _cell(row, NOTE_COL):
+        return None
+    return PendingEntry(
+        row=row_number,
+        month=to_month(_cell(row, DATE_COL)),
+        driver=_cell(row, NAME_COL),
+        submission_id=_cell(row, ID_COL),
+    )
+
+
+class PendingIndex:
+    """
+    Thread-safe map of sheet row number -> PendingEntry for 未定 ledger rows.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_values(cls, values):
+        index = cls()
+        index.rebuild(values)
+        return index
+
+    @staticmethod
+    def scan(values):
+        """
+        Scans `get_all_values()` output (header row first) for 未定 rows.
+        """
+        entries = {}
+        for i, row in enumerate(values[1:], start=2):  # Sheet rows are 1-based, row 1 is the header
+            entry = _entry_for(i, row)
+            if entry:
+                entries[entry.row] = entry
+        return entries
+
+    def rebuild(self, values):
+        entries = self.scan(values)
+        with self._lock:
+            self._entries = entries
+
+    def record_append(self, start_row, rows):
+        """
+        Adds the 未定 rows among `rows`, which were appended starting at `start_row`.
+        """
+        with self._lock:
+            for offset, row in enumerate(rows):
+                entry = _entry_for(start_row + offset, row)
+                if entry:
+                    self._entries[entry.row] = entry
+
+    def resolve(self, row_numbers):
+        with self._lock:
+            for row_number in row_numbers:
+                self._entries.pop(row_number, None)
+
+    def entries(self):
+        with self._lock:
+            return sorted(self._entries.values())
+
+    def rows_for(self, month, driver):
+        with self._lock:
+            return sorted(e.row for e in self._entries.values() if e.month == month and e.driver == driver)
+
+    def pending_keys(self):
+        """
+        Returns the set of (month, driver) pairs that have at least one 未定 row.
+        """
+        with self._lock:
+            return {(e.month, e.driver) for e in self._entries.values()}
+
+    def check(self, values):
+        """
+        Compares the index with a fresh sheet scan.
+        Returns (missing, stale): entries absent from the index, and indexed entries no longer in the sheet.
+        """
+        actual = self.scan(values)
+        with self._lock:
+            current = dict(self._entries)
+        missing = [e for row, e in sorted(actual.items()) if current.get(row) != e]
+        stale = [e for row, e in sorted(current.items()) if actual.get(row) != e]
+        return missing, stale
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
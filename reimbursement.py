@@ -0,0 +1,53 @@
+"""
+Driving distance from the base location and the distance -> 車代 tier table.
+"""
+
+BASE_LOCATION = "埼玉県和光市南1丁目5番10号"  # ⚠️ Change to your base location (e.g., your office)
+
+# (upper bound in km, amount in yen); distances at or past the last bound get FINAL_TIER_AMOUNT
+# ⚠️ Modify tiers based on your reimbursement policy.
+DEFAULT_TIERS = ((5, 200), (10, 400), (20, 600), (30, 800), (40, 1000), (50, 1200))
+FINAL_TIER_AMOUNT = 1500
+
+# The Distance Matrix API accepts at most 25 destinations per request
+MAX_DESTINATIONS_PER_REQUEST = 25
+
+
+def calculate_reimbursement(distance_km, tiers=DEFAULT_TIERS, final_amount=FINAL_TIER_AMOUNT):
+    """
+    Returns the reimbursement amount based on distance.
+    """
+    for upper_km, amount in tiers:
+        if distance_km < upper_km:
+            return amount
+    return final_amount
+
+
+def get_distance(gmaps, destination, origin=BASE_LOCATION):
+    """
+    Returns the driving distance in kilometers from `origin` to the destination.
+    """
+    return get_distances(gmaps, [destination], origin)[destination]
+
+
+def get_distances(gmaps, destinations, origin=BASE_LOCATION):
+    """
+    Returns {destination: km} for many destinations, batching Distance Matrix requests.
+    Destinations the API can't route map to None.
+    """
+    unique = list(dict.fromkeys(destinations))
+    distances = {}
+    for start in range(0, len(unique), MAX_DESTINATIONS_PER_REQUEST):
+        batch = unique[start:start + MAX_DESTINATIONS_PER_REQUEST]
+        result = gmaps.distance_matrix(
+            origins=origin,
+            destinations=batch,
+            mode="driving",
+            avoid="tolls",
+        )
+        for destination, element in zip(batch, result["rows"][0]["elements"]):
+            if element.get("status", "OK") == "OK":
+                distances[destination] = element["distance"]["value"] / 1000  # Convert meters to km
+            else:
+                distances[destination] = None
+    return distances
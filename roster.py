@@ -0,0 +1,119 @@
+"""
+Sheet2 / Sheet3 rosters (名前, 学年, 親, 運転手, 定員) and local roster files.
+"""
+import csv
+import hashlib
+import json
+from dataclasses import dataclass
+from types import MappingProxyType
+
+ROSTER_COLUMNS = ["名前", "学年", "運転手", "定員", "親"]
+
+
+def _records(values):
+    if not values:
+        return []
+    header = [str(h).strip() for h in values[0]]
+    return [dict(zip(header, [str(v).strip() for v in row] + [""] * (len(header) - len(row)))) for row in values[1:]]
+
+
+def players_from_values(values):
+    """
+    Returns [{"名前", "学年", "親"}] from `get_all_values()` output, skipping blank names.
+    """
+    return [
+        {"名前": r.get("名前", ""), "学年": r.get("学年", ""), "親": r.get("親", "")}
+        for r in _records(values) if r.get("名前")
+    ]
+
+
+def drivers_from_values(values):
+    """
+    Returns [{"運転手", "定員"}] from `get_all_values()` output, skipping incomplete rows.
+    """
+    return [
+        {"運転手": r["運転手"], "定員": r["定員"]}
+        for r in _records(values) if r.get("運転手") and r.get("定員")
+    ]
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+@dataclass(frozen=True, slots=True)
+class Roster:
+    """
+    Parsed, immutable snapshot of one roster sheet version, shared by every session.
+
+    Columns are stored as parallel tuples; `name_index` maps 名前 -> position,
+    `driver_index` maps 運転手 -> position and `grade_buckets` maps 学年 -> names.
+    """
+
+    version: str
+    names: tuple
+    grades: tuple
+    parents: tuple
+    drivers: tuple
+    capacities: tuple
+    name_index: MappingProxyType
+    driver_index: MappingProxyType
+    grade_buckets: MappingProxyType
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Builds a snapshot from `get_all_values()` output; `version` is a digest of the values.
+        """
+        digest = hashlib.sha1(json.dumps(values, ensure_ascii=False).encode("utf-8")).hexdigest()
+        players = players_from_values(values)
+        drivers = drivers_from_values(values)
+
+        names = tuple(p["名前"] for p in players)
+        grades = tuple(_int(p["学年"]) for p in players)
+        buckets = {}
+        for name, grade in zip(names, grades):
+            buckets.setdefault(grade, []).append(name)
+
+        driver_names = tuple(d["運転手"] for d in drivers)
+        return cls(
+            version=digest[:12],
+            names=names,
+            grades=grades,
+            parents=tuple(p["親"] for p in players),
+            drivers=driver_names,
+            capacities=tuple(_int(d["定員"]) for d in drivers),
+            name_index=MappingProxyType({name: i for i, name in enumerate(names)}),
+            driver_index=MappingProxyType({driver: i for i, driver in enumerate(driver_names)}),
+            grade_buckets=MappingProxyType({grade: tuple(bucket) for grade, bucket in buckets.items()}),
+        )
+
+    def grade_of(self, name):
+        i = self.name_index.get(name)
+        return self.grades[i] if i is not None else None
+
+    def parent_of(self, name):
+        i = self.name_index.get(name)
+        return self.parents[i] if i is not None else ""
+
+    def capacity_of(self, driver):
+        i = self.driver_index.get(driver)
+        return self.capacities[i] if i is not None else 0
+
+    def driver_capacities(self):
+        return {driver: self.capacities[i] for driver, i in self.driver_index.items()}
+
+
+def read_values(path):
+    """
+    Reads a local roster/ledger file into `get_all_values()` shape (header row first).
+    Accepts CSV, or JSON holding a list of rows as dumped from the sheet.
+    """
+    if str(path).endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return [[str(v) for v in row] for row in json.load(f)]
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [row for row in csv.reader(f)]
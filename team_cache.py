@@ -0,0 +1,299 @@
+"""
+Per-team clients, roster snapshots, 未定 index, distance cache and assignment
+store, held in one process-wide registry with a memory budget and idle-team
+eviction.
+
+Remote clients are created through injected factories so the same code runs
+against Google APIs in the app and against local fakes in tests/benchmarks.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from assignment_store import HISTORY_COLUMNS, HISTORY_SHEET, AssignmentStore
+from metrics import deep_sizeof
+from pending_index import PendingIndex
+from reimbursement import calculate_reimbursement, get_distance
+from roster import Roster
+
+ROSTER_TTL_SECONDS = 600
+DISTANCE_CACHE_SIZE = 256
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_IDLE_SECONDS = 30 * 60
+SIZE_CHECK_INTERVAL_SECONDS = 30
+HISTORY_RETRY_SECONDS = 5 * 60
+
+logger = logging.getLogger(__name__)
+
+
+class TeamContext:
+    """
+    Lazily created resources for one team. Worksheets and clients are opened on first use.
+
+    `_lock` only guards the cached state: remote calls run without it, so a slow Sheets
+    call never blocks data_size() or the other threads of this team.
+    """
+
+    def __init__(self, team, open_spreadsheet, maps_client, clock=time.monotonic):
+        self.team = team
+        self._open_spreadsheet = open_spreadsheet
+        self._maps_client = maps_client
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._history_lock = threading.Lock()  # One 割り当て履歴 open/create at a time
+        self._spreadsheet = None
+        self._worksheets = {}
+        self._rosters = {}  # title -> (fetched_at, Roster)
+        self._pending_index = None
+        self._distances = OrderedDict()
+        self._assignment_store = None
+        self._history_failed_at = None
+        self.last_used = clock()
+
+    @property
+    def spreadsheet(self):
+        with self._lock:
+            if self._spreadsheet is not None:
+                return self._spreadsheet
+        spreadsheet = self._open_spreadsheet(self.team.sheet_id)
+        with self._lock:
+            if self._spreadsheet is None:  # ✅ First opener wins if two threads raced
+                self._spreadsheet = spreadsheet
+            return self._spreadsheet
+
+    def worksheet(self, title):
+        with self._lock:
+            if title in self._worksheets:
+                return self._worksheets[title]
+        worksheet = self.spreadsheet.worksheet(title)
+        with self._lock:
+            return self._worksheets.setdefault(title, worksheet)
+
+    def roster(self, title):
+        """
+        Returns the shared Roster snapshot for a worksheet, refetched after ROSTER_TTL_SECONDS.
+        """
+        with self._lock:
+            cached = self._rosters.get(title)
+            if cached and self._clock() - cached[0] < ROSTER_TTL_SECONDS:
+                return cached[1]
+        snapshot = Roster.from_values(self.worksheet(title).get_all_values())
+        with self._lock:
+            # ✅ Keep the existing object if the sheet hasn't changed, so sessions share one snapshot
+            if cached and cached[1].version == snapshot.version:
+                snapshot = cached[1]
+            self._rosters[title] = (self._clock(), snapshot)
+        return snapshot
+
+    def pending_index(self, title="Sheet1"):
+        with self._lock:
+            if self._pending_index is not None:
+                return self._pending_index
+        index = PendingIndex.from_values(self.worksheet(title).get_all_values())
+        with self._lock:
+            if self._pending_index is None:
+                self._pending_index = index
+            return self._pending_index
+
+    def distance(self, destination):
+        """
+        Returns the driving distance in km from the team's base location, cached per destination.
+        """
+        with self._lock:
+            if destination in self._distances:
+                self._distances.move_to_end(destination)
+                return self._distances[destination]
+        distance_km = get_distance(self._maps_client(self.team), destination, self.team.base_location)
+        if distance_km is not None:
+            with self._lock:
+                self._distances[destination] = distance_km
+                while len(self._distances) > DISTANCE_CACHE_SIZE:
+                    self._distances.popitem(last=False)
+        return distance_km
+
+    def assignment_store(self, create=True):
+        """
+        Returns the team's AssignmentStore, warmed from the tail of the 割り当て履歴 worksheet
+        (created on first use). With create=False, returns None until a store exists, so
+        just viewing a tab never touches the sheet.
+
+        If the history sheet can't be opened, an in-memory store (`persistent` False) is
+        used instead and the sheet is tried again after HISTORY_RETRY_SECONDS.
+        """
+        with self._lock:
+            store = self._assignment_store
+            if not create or not self._needs_history(store):
+                return store
+        with self._history_lock:
+            with self._lock:
+                fallback = self._assignment_store
+                if not self._needs_history(fallback):
+                    return fallback  # Opened by another thread meanwhile
+            try:
+                store = self._open_assignment_store()
+                for record in reversed(fallback.recent(limit=fallback.max_entries) if fallback else []):
+                    # ✅ Results kept in memory while the sheet was unavailable go into the history now
+                    store.put(**{k: v for k, v in record.items() if k != "created"})
+            except Exception:
+                logger.exception("could not open assignment history for team %s", self.team.key)
+                store = fallback or AssignmentStore()
+                with self._lock:
+                    self._history_failed_at = self._clock()
+            with self._lock:
+                self._assignment_store = store
+            return store
+
+    def _needs_history(self, store):
+        # No store yet, or an in-memory fallback whose retry time has come
+        return store is None or (
+            not store.persistent and self._clock() - self._history_failed_at >= HISTORY_RETRY_SECONDS
+        )
+
+    def _open_assignment_store(self):
+        worksheet = self._history_worksheet()
+        store = AssignmentStore(write_rows=lambda rows: worksheet.append_rows(rows, value_input_option="RAW"))
+        # ✅ The grid (row_count) may be larger than the data, e.g. a hand-made sheet with 1000
+        #    empty rows, so the last data row comes from column A (日時, never blank)
+        last = len(worksheet.col_values(1))
+        # ✅ Only the newest rows are read in full, so cold start doesn't grow with the history
+        first = max(2, last - store.max_entries + 1)
+        last_column = chr(ord("A") + len(HISTORY_COLUMNS) - 1)
+        store.load(worksheet.get(f"A{first}:{last_column}{last}") if last > 1 else [])
+        return store
+
+    def _history_worksheet(self):
+        if HISTORY_SHEET not in {ws.title for ws in self.spreadsheet.worksheets()}:
+            # rows=1 so the grid only grows with appended history
+            worksheet = self.spreadsheet.add_worksheet(HISTORY_SHEET, rows=1, cols=len(HISTORY_COLUMNS))
+            worksheet.update("A1", [HISTORY_COLUMNS])
+        return self.worksheet(HISTORY_SHEET)
+
+    def close(self):
+        """
+        Writes out buffered assignment history before the team is dropped.
+        """
+        with self._lock:
+            store = self._assignment_store
+        if store is not None:
+            try:
+                store.close()  # ✅ Sessions still holding this context keep writing through
+            except Exception:
+                logger.exception("could not flush assignment history for team %s", self.team.key)
+
+    def reimbursement(self, distance_km):
+        return calculate_reimbursement(distance_km, self.team.tiers, self.team.final_amount)
+
+    def data_size(self):
+        """
+        Approximate bytes held in team data (rosters, index, distances); clients are not counted.
+        """
+        with self._lock:
+            return deep_sizeof((self.team, self._rosters, self._pending_index, self._distances, self._assignment_store))
+
+
+class TeamRegistry:
+    """
+    Process-wide map of team key -> TeamContext with a total memory budget.
+
+    Teams idle for longer than `idle_seconds` are dropped, and if the total data
+    size is still above `max_bytes` the least recently used teams go next.
+    """
+
+    def __init__(self, teams, open_spreadsheet, maps_client,
+                 max_bytes=DEFAULT_MAX_BYTES, idle_seconds=DEFAULT_IDLE_SECONDS, clock=time.monotonic):
+        self.teams = dict(teams)
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._open_spreadsheet = open_spreadsheet
+        self._maps_client = maps_client
+        self._clock = clock
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+        self._size_checked_at = None
+
+    def get(self, key):
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is None:
+                context = TeamContext(self.teams[key], self._open_spreadsheet, self._maps_client, self._clock)
+                self._contexts[key] = context
+                self._size_checked_at = None  # ✅ A new team always triggers a size check
+            context.last_used = self._clock()
+            self._contexts.move_to_end(key)
+            evicted = self._evict_idle(keep=key)
+            to_size = self._contexts_to_size()
+
+        # ✅ Sizing takes each team's own lock, so it runs after the registry lock is released
+        if to_size is not None:
+            sizes = {k: c.data_size() for k, c in to_size}
+            with self._lock:
+                evicted += self._evict_over_budget(sizes, keep=key)
+
+        # ✅ close() may write to Sheets, so it also runs outside the registry lock
+        for dropped in evicted:
+            dropped.close()
+        return context
+
+    def _evict_idle(self, keep):
+        """
+        Removes contexts idle for longer than `idle_seconds` (lock held) and returns them for closing.
+        """
+        now = self._clock()
+        return [
+            self._contexts.pop(k)
+            for k, c in list(self._contexts.items()) if k != keep and now - c.last_used > self.idle_seconds
+        ]
+
+    def _contexts_to_size(self):
+        # ✅ Sizing walks every team's data, so only do it every SIZE_CHECK_INTERVAL_SECONDS
+        now = self._clock()
+        if self._size_checked_at is not None and now - self._size_checked_at < SIZE_CHECK_INTERVAL_SECONDS:
+            return None
+        self._size_checked_at = now
+        return list(self._contexts.items())
+
+    def _evict_over_budget(self, sizes, keep):
+        """
+        Removes least recently used contexts until the sized total fits `max_bytes` (lock held).
+        """
+        evicted = []
+        total = sum(size for k, size in sizes.items() if k in self._contexts)
+        for key in list(self._contexts):
+            if total <= self.max_bytes:
+                break
+            if key != keep and key in sizes:
+                total -= sizes[key]
+                evicted.append(self._contexts.pop(key))
+        return evicted
+
+    def set_teams(self, teams):
+        """
+        Applies a reloaded teams config; loaded contexts of removed or changed teams are dropped.
+        """
+        with self._lock:
+            self.teams = dict(teams)
+            dropped = [self._contexts.pop(k) for k, c in list(self._contexts.items()) if self.teams.get(k) != c.team]
+        for context in dropped:
+            context.close()
+
+    def close_all(self):
+        """
+        Flushes every team's buffered history (registered with atexit by the app).
+        """
+        with self._lock:
+            contexts = list(self._contexts.values())
+        for context in contexts:
+            context.close()
+
+    def stats(self):
+        """
+        Returns one row per loaded team with its data size and idle time.
+        """
+        with self._lock:
+            now = self._clock()
+            contexts = list(self._contexts.items())
+        return [
+            {"team": key, "KB": round(c.data_size() / 1024, 1), "idle_s": round(now - c.last_used)}
+            for key, c in contexts
+        ]
@@ -0,0 +1,74 @@
+"""
+Team configuration for hosting several teams from one server process.
+
+Teams are read from Streamlit secrets, one table per team:
+
+    [teams.fz]
+    name = "Fz"
+    sheet_id = "1upehCYwnGEcKg_zVQG7jlnNUykFmvNbuAtnxzqvSEcA"
+    base_location = "埼玉県和光市南1丁目5番10号"
+    drivers = ["平野", "ケイン"]
+    tiers = [[5, 200], [10, 400], [20, 600], [30, 800], [40, 1000], [50, 1200]]
+    final_amount = 1500
+    # Optional: team-specific login and Maps key (default to [app] / [google_maps])
+    username = "..."
+    password = "..."
+    maps_api_key = "..."
+
+Without a [teams] section the app serves DEFAULT_TEAM. This module must stay
+import-light because the login screen uses it.
+"""
+from dataclasses import dataclass
+
+from reimbursement import BASE_LOCATION, DEFAULT_TIERS, FINAL_TIER_AMOUNT
+
+
+@dataclass(frozen=True)
+class Team:
+    key: str
+    name: str
+    sheet_id: str
+    base_location: str = BASE_LOCATION
+    drivers: tuple = ()
+    tiers: tuple = DEFAULT_TIERS
+    final_amount: int = FINAL_TIER_AMOUNT
+    username: str = ""
+    password: str = ""
+    maps_api_key: str = ""
+
+
+DEFAULT_TEAM = Team(
+    key="fz",
+    name="Fz",
+    sheet_id="1upehCYwnGEcKg_zVQG7jlnNUykFmvNbuAtnxzqvSEcA",
+    drivers=("平野", "ケイン", "山﨑", "萩原", "仙波し", "仙波ち", "久保", "落合", "浜島", "野波",
+             "末田", "芳本", "鈴木", "山田", "佐久間", "今井", "西川"),
+)
+
+
+def team_from_config(key, config):
+    """
+    Builds a Team from one [teams.<key>] table; missing fields fall back to the defaults.
+    """
+    tiers = config.get("tiers")
+    return Team(
+        key=key,
+        name=config.get("name", key),
+        sheet_id=config["sheet_id"],
+        base_location=config.get("base_location", BASE_LOCATION),
+        drivers=tuple(config.get("drivers", ())),
+        tiers=tuple((float(km), int(amount)) for km, amount in tiers) if tiers else DEFAULT_TIERS,
+        final_amount=int(config.get("final_amount", FINAL_TIER_AMOUNT)),
+        username=config.get("username", ""),
+        password=config.get("password", ""),
+        maps_api_key=config.get("maps_api_key", ""),
+    )
+
+
+def load_teams(config):
+    """
+    Returns {key: Team} from the [teams] secrets section, or just DEFAULT_TEAM if there is none.
+    """
+    if not config:
+        return {DEFAULT_TEAM.key: DEFAULT_TEAM}
+    return {key: team_from_config(key, dict(table)) for key, table in config.items()}